@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from benchmarks.bench_transform import RESULTS_DIR, _git_commit
+from benchmarks.generate_raw_data import generate_raw_files
+from etl.staging import staging_dataset, write_staging, write_staging_dataset
+from etl.transform import deduplicate, transform_files
+
+# Typical dashboard / ad-hoc filters, with the matching pyarrow filter used to
+# count the partition files a reader has to open
+QUERIES = {
+    "full_scan_avg_by_city": (
+        "SELECT city, avg(weighted_avg), avg(min_price) FROM {src} GROUP BY city",
+        lambda p: None),
+    "one_city": (
+        "SELECT zone, avg(weighted_avg) FROM {src} WHERE city = 'Tangier' GROUP BY zone",
+        lambda p: ds.field('city') == 'Tangier'),
+    "last_7_days": (
+        "SELECT count(*), avg(max_price) FROM {src} WHERE scrape_timestamp >= TIMESTAMP '{since}'",
+        lambda p: ds.field('scrape_date') >= pa.scalar(pd.Timestamp(p['since']).date())),
+    "one_city_one_day": (
+        "SELECT category, avg(weighted_avg) FROM {src} "
+        "WHERE city = 'Marrakech' AND scrape_timestamp >= TIMESTAMP '{day}' "
+        "AND scrape_timestamp < TIMESTAMP '{day}' + INTERVAL 1 DAY GROUP BY category",
+        lambda p: (ds.field('scrape_date') == pa.scalar(pd.Timestamp(p['day']).date()))
+                  & (ds.field('city') == 'Marrakech')),
+}
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def bench(n_rows, n_files, work_dir, repeat=3):
+    files = generate_raw_files(os.path.join(work_dir, "raw"), n_rows, n_files)
+    staged, _ = deduplicate(pd.concat([df for df, _, _ in transform_files(files, 0)], ignore_index=True))
+
+    staging_dir = os.path.join(work_dir, "staging")
+    os.makedirs(staging_dir, exist_ok=True)
+    flat_path = write_staging(staged, "flat", staging_dir)
+    dataset_path = os.path.join(staging_dir, "staged_bookingpartitioned")
+    write_staging_dataset(pa.Table.from_pandas(staged, preserve_index=False), dataset_path)
+
+    last_ts = staged.scrape_timestamp.max()
+    params = {
+        'since': (last_ts - pd.Timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S'),
+        'day': last_ts.strftime('%Y-%m-%d'),
+    }
+    sources = {
+        "flat": f"read_parquet('{flat_path}')",
+        "partitioned": f"read_parquet('{dataset_path}/**/*.parquet', hive_partitioning = true)",
+    }
+
+    con = duckdb.connect()
+    dataset = staging_dataset(dataset_path)
+    n_fragments = len(list(dataset.get_fragments()))
+    result = {
+        "rows": len(staged),
+        "bytes": {"flat": _dir_size(flat_path), "partitioned": _dir_size(dataset_path)},
+        "partition_files": n_fragments,
+        "queries": {},
+    }
+    for name, (sql, arrow_filter) in QUERIES.items():
+        entry = {}
+        for layout, src in sources.items():
+            query = sql.format(src=src, **params)
+            entry[layout + "_seconds"] = _best_of(lambda: con.execute(query).fetchall(), repeat)
+        arrow_filter = arrow_filter(params)
+        entry["partition_files_touched"] = (
+            n_fragments if arrow_filter is None else len(list(dataset.get_fragments(filter=arrow_filter))))
+        result["queries"][name] = entry
+    con.close()
+    return result
+
+
+def _print_result(result):
+    print(f"\n{result['rows']} staged rows, flat {result['bytes']['flat'] / 2 ** 20:.1f} MB, "
+          f"partitioned {result['bytes']['partitioned'] / 2 ** 20:.1f} MB in {result['partition_files']} files")
+    for name, entry in result["queries"].items():
+        print(f"    {name:<24} flat {entry['flat_seconds']:.4f}s  partitioned {entry['partitioned_seconds']:.4f}s  "
+              f"({entry['partition_files_touched']}/{result['partition_files']} files)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scans of the flat and partitioned staging layouts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix=f"bench_staging_scan_{n_rows}_")
+        try:
+            result = bench(n_rows, args.files, work_dir, args.repeat)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        _print_result(result)
+        results.append(result)
+
+    commit = _git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"staging_scan_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(path, "w") as f:
+        json.dump({"commit": commit, "created_at": datetime.now().isoformat(), "results": results}, f, indent=2)
+    print(f"\nResults saved to {path}")
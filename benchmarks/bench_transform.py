@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+from benchmarks.generate_raw_data import generate_raw_files
+from etl.transform import (
+    normalize_timestamps, fix_city_names, add_weighted_avg, backfill_zones, deduplicate, transform_files,
+)
+from etl.keys import add_surrogate_keys, update_key_maps
+from etl.quality import apply_quality_rules
+from etl.staging import write_staging, write_staging_dataset
+
+RESULTS_DIR = "./benchmarks/results"
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class StageTimer:
+    """Accumulates wall time and peak traced memory per transform stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "peak_mb": 0.0})
+            entry["seconds"] += elapsed
+            entry["peak_mb"] = max(entry["peak_mb"], peak / 2 ** 20)
+
+
+def bench_size(n_rows, n_files, work_dir, workers=1):
+    raw_dir = os.path.join(work_dir, "raw")
+    staging_dir = os.path.join(work_dir, "staging")
+    # empty key maps of the benchmark run, not the pipeline's data/keys
+    key_map_dir = os.path.join(work_dir, "keys")
+    os.makedirs(staging_dir, exist_ok=True)
+    files = generate_raw_files(raw_dir, n_rows, n_files)
+
+    timer = StageTimer()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    frames = []
+    for file_path in files:
+        with timer.stage("read_csv"):
+            df = pd.read_csv(file_path)
+        with timer.stage("normalize_timestamps"):
+            df = normalize_timestamps(df)
+        with timer.stage("fix_city_names"):
+            df = fix_city_names(df)
+        with timer.stage("add_weighted_avg"):
+            df = add_weighted_avg(df)
+        with timer.stage("quality_rules"):
+            df, _, _ = apply_quality_rules(df)
+        with timer.stage("backfill_zones"):
+            df = backfill_zones(df)
+        frames.append(df)
+
+    with timer.stage("concat"):
+        combined_df = pd.concat(frames, ignore_index=True)
+    with timer.stage("deduplicate"):
+        combined_df, _ = deduplicate(combined_df)
+    with timer.stage("add_surrogate_keys"):
+        combined_df = add_surrogate_keys(combined_df)
+    with timer.stage("update_key_maps"):
+        update_key_maps(combined_df, key_map_dir)
+    # the same rows again: every member known, the cost of a rerun over existing maps
+    with timer.stage("update_key_maps_known"):
+        update_key_maps(combined_df, key_map_dir)
+    with timer.stage("write_staging_flat"):
+        write_staging(combined_df, "bench", staging_dir)
+    with timer.stage("write_staging_partitioned"):
+        write_staging_dataset(pa.Table.from_pandas(combined_df, preserve_index=False),
+                              os.path.join(staging_dir, "staged_booking_bench"))
+
+    total = time.perf_counter() - start
+    tracemalloc.stop()
+
+    result = {
+        "rows": n_rows,
+        "files": n_files,
+        "rows_out": len(combined_df),
+        "total_seconds": total,
+        "stages": timer.stages,
+    }
+
+    if workers != 1:
+        # end-to-end per-file pass through the process pool, for comparison with the serial stages
+        start = time.perf_counter()
+        transform_files(files, workers)
+        result["transform_files_parallel_seconds"] = time.perf_counter() - start
+        result["workers"] = workers or os.cpu_count()
+
+    # ru_maxrss is in KiB on Linux and covers arrow buffers tracemalloc does not see
+    result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def _print_result(result):
+    print(f"\n{result['rows']:>10} rows ({result['files']} files) -> {result['rows_out']} rows "
+          f"in {result['total_seconds']:.2f}s, max rss {result['max_rss_mb']:.0f} MB")
+    for name, entry in result["stages"].items():
+        print(f"    {name:<22}{entry['seconds']:>9.3f}s {entry['peak_mb']:>10.1f} MB peak")
+    if "transform_files_parallel_seconds" in result:
+        print(f"    per-file steps on {result['workers']} workers: {result['transform_files_parallel_seconds']:.3f}s")
+
+
+def run(sizes, n_files, workers=1, keep_data=False):
+    results = []
+    for n_rows in sizes:
+        work_dir = tempfile.mkdtemp(prefix=f"bench_transform_{n_rows}_")
+        try:
+            result = bench_size(n_rows, n_files, work_dir, workers)
+        finally:
+            if not keep_data:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        _print_result(result)
+        results.append(result)
+
+    commit = _git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"transform_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(path, "w") as f:
+        json.dump({"commit": commit, "created_at": datetime.now().isoformat(), "results": results}, f, indent=2)
+    print(f"\nResults saved to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    # Each size is best run in its own process so max_rss is not inherited from a bigger run:
+    #   python -m benchmarks.bench_transform --sizes 1000000
+    parser = argparse.ArgumentParser(description="Time every transform stage at several data sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1, help="also time the process pool (0 = all cores)")
+    parser.add_argument("--keep-data", action="store_true")
+    args = parser.parse_args()
+
+    run(args.sizes, args.files, args.workers, args.keep_data)
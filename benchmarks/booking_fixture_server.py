@@ -0,0 +1,227 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for Booking.com search / property pages and the Nominatim reverse geocoder.
+# The pages carry the markup the scraper's selectors look for; recorded pages can replace
+# them (FIXTURE_PAGES_DIR/search.html, property.html with the same {placeholders}).
+FIXTURE_PAGES_DIR = os.getenv("FIXTURE_PAGES_DIR", "")
+
+# per route: median latency (ms) and spread (sigma of the lognormal) of the responses
+DEFAULT_LATENCY = {"search": (800, 0.5), "property": (1200, 0.6), "reverse": (150, 0.4)}
+DEFAULT_FAULTS = {"throttle_rate": 0.02, "captcha_rate": 0.01, "error_rate": 0.01}
+
+CITIES = {"marrakech": (31.63, -8.01), "tangier": (35.77, -5.80)}
+CATEGORIES = ["Hotel", "Riad", "Apartment", "Guest House", "Hostel", "Villa"]
+ZONES = ["Medina", "Gueliz", "L'Hivernage", "Kasbah", "Malabata", "Sidi Abbad"]
+TRAVELER_TYPES = ["Couple", "Family", "Solo traveler", "Group", "Business traveller"]
+
+SEARCH_PAGE = """<html><body>
+<button id="onetrust-accept-btn-handler">Accept</button>
+{cards}
+</body></html>"""
+
+SEARCH_CARD = """<div data-testid="property-card"><h3 data-testid="title">
+<a data-testid="title-link" href="{url}">{name}</a></h3></div>"""
+
+PROPERTY_PAGE = """<html><body>
+<span data-testid="breadcrumb-current"><span>{name} ({category}) ({city})</span></span>
+<table>{price_rows}</table>
+<div>Free WiFi • {wifi} Mbps</div>
+<div id="js--hp-gallery-scorecard"><a href="#tab-reviews"><div><div><div>
+<div>Scored</div><div>{score}</div><div>Very good</div><div><div>Reviews</div><div>{review_count} reviews</div></div>
+</div></div></div></a></div>
+{subscores}
+<select name="customerType"><option value="ALL">All</option><option value="BUSINESS_TRAVELLERS">Business</option></select>
+<div id="reviewCardsSection"><div></div><div><div><div><div>
+<div>{reviews}</div><div></div><div><button class="disabled">Next page</button></div>
+</div></div></div></div></div>
+<script>window.property = {{"latitude":{lat},"longitude":{lon}}};</script>
+</body></html>"""
+
+CAPTCHA_PAGE = "<html><body><h1>Please verify you are a human</h1><div>captcha</div></body></html>"
+
+
+def _load_page(name, default):
+    path = os.path.join(FIXTURE_PAGES_DIR, name) if FIXTURE_PAGES_DIR else ""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    return default
+
+
+def property_page(slug, city):
+    """Property page with reviews; the same slug always renders the same property"""
+    rng = random.Random(slug)
+    lat, lon = CITIES.get(city, (31.63, -8.01))
+    prices = sorted(rng.randint(300, 4000) for _ in range(rng.randint(1, 4)))
+    price_rows = "".join(
+        '<tr><td class="hprt-table-cell-price"><div class="hprt-price-block"><div class="prco-wrapper">'
+        f'<span class="prco-valign-middle-helper">MAD {price:,}</span></div></div></td></tr>'
+        for price in prices)
+    subscores = "".join(
+        f'<div data-testid="review-subscore"><span>Score {i}</span><div aria-hidden="true">{rng.uniform(6, 10):.1f}</div></div>'
+        for i in range(1, 8))
+    reviews = "".join(
+        f'<div data-testid="review-card"><div>Scored {rng.uniform(4, 10):.1f}</div>'
+        f'<span data-testid="review-traveler-type">{rng.choice(TRAVELER_TYPES)}</span></div>'
+        for _ in range(rng.randint(3, 10)))
+    return _load_page("property.html", PROPERTY_PAGE).format(
+        name=slug.replace("-", " ").title(), category=rng.choice(CATEGORIES), city=city.title(),
+        price_rows=price_rows, wifi=rng.choice([10, 25, 50, 100]), score=f"{rng.uniform(6, 9.8):.1f}",
+        review_count=rng.randint(10, 5000), subscores=subscores, reviews=reviews,
+        lat=round(lat + rng.uniform(-0.05, 0.05), 6), lon=round(lon + rng.uniform(-0.05, 0.05), 6))
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Serves the fixture pages with injected latency, 429 throttling, captchas and 500 errors.
+
+    Every response is recorded (route, status, injected latency) in stats, so a
+    load test can compare what was served with what the scraper got out of it.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, properties_per_city=30, latency=None, faults=None, seed=None, public_url=None):
+        super().__init__(address, FixtureHandler)
+        self.properties_per_city = properties_per_city
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.faults = {**DEFAULT_FAULTS, **(faults or {})}
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        # base url of the links in the pages, as the browser reaches the server
+        host = "localhost" if address[0] in ("", "0.0.0.0") else address[0]
+        self.public_url = public_url or f"http://{host}:{self.server_address[1]}"
+        self.stats = []
+        self.stats_lock = threading.Lock()
+
+    def draw(self, route):
+        """Latency (s) and outcome of the next response of a route"""
+        median_ms, sigma = self.latency[route]
+        with self.rng_lock:
+            latency = median_ms / 1000 * math.exp(self.rng.gauss(0, sigma))
+            roll = self.rng.random()
+        faults = self.faults
+        if roll < faults["throttle_rate"]:
+            outcome = "throttled"
+        elif roll < faults["throttle_rate"] + faults["error_rate"]:
+            outcome = "error"
+        elif route != "reverse" and roll < faults["throttle_rate"] + faults["error_rate"] + faults["captcha_rate"]:
+            outcome = "captcha"
+        else:
+            outcome = "ok"
+        return latency, outcome
+
+    def record(self, route, status, outcome, latency):
+        with self.stats_lock:
+            self.stats.append({"route": route, "status": status, "outcome": outcome, "latency": latency,
+                               "at": time.time()})
+
+    def summary(self, since=0):
+        with self.stats_lock:
+            served = [s for s in self.stats if s["at"] >= since]
+        return {
+            "requests": len(served),
+            "outcomes": dict(Counter(f"{s['route']}:{s['outcome']}" for s in served)),
+        }
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/searchresults.html":
+            route = "search"
+        elif url.path.startswith("/hotel/"):
+            route = "property"
+        elif url.path == "/reverse":
+            route = "reverse"
+        else:
+            self._send(404, "not found")
+            return
+
+        server = self.server
+        latency, outcome = server.draw(route)
+        time.sleep(latency)
+        if outcome == "throttled":
+            status, body = 429, "Too Many Requests"
+            self._send(status, body, headers={"Retry-After": "1"})
+        elif outcome == "error":
+            status = 500
+            self._send(status, "Internal Server Error")
+        elif outcome == "captcha":
+            status = 200
+            self._send(status, CAPTCHA_PAGE)
+        else:
+            status = 200
+            if route == "search":
+                city = query.get("ss", ["marrakech"])[0].lower()
+                cards = "".join(
+                    SEARCH_CARD.format(url=f"{server.public_url}/hotel/ma/{city}-property-{i}.html?city={city}",
+                                       name=f"{city.title()} Property {i}")
+                    for i in range(server.properties_per_city))
+                self._send(status, _load_page("search.html", SEARCH_PAGE).format(cards=cards))
+            elif route == "property":
+                slug = url.path.rsplit("/", 1)[-1].removesuffix(".html")
+                self._send(status, property_page(slug, query.get("city", ["marrakech"])[0]))
+            else:
+                rng = random.Random(f"{query.get('lat')}{query.get('lon')}")
+                zone = rng.choice(ZONES)
+                self._send(status, json.dumps({
+                    "display_name": f"{zone}, Morocco",
+                    "address": {"suburb": zone, "city": rng.choice(["Marrakech", "Tangier"])},
+                }), content_type="application/json")
+        server.record(route, status, outcome, latency)
+
+
+def start_server(host="0.0.0.0", port=8765, **options):
+    """Start a fixture server in a background thread, returns it (server.shutdown() stops it)"""
+    server = FixtureServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    #   python -m benchmarks.booking_fixture_server --port 8765 --throttle-rate 0.05
+    # then BOOKING_BASE_URL=http://<host>:8765 NOMINATIM_URL=http://<host>:8765/reverse for the scraper
+    parser = argparse.ArgumentParser(description="Local Booking.com / Nominatim fixture with latency and faults")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--public-url", help="base url of the page links, as the browser reaches this server")
+    parser.add_argument("--properties", type=int, default=30, help="properties per searched city")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every median latency")
+    parser.add_argument("--throttle-rate", type=float, default=DEFAULT_FAULTS["throttle_rate"])
+    parser.add_argument("--captcha-rate", type=float, default=DEFAULT_FAULTS["captcha_rate"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_FAULTS["error_rate"])
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    latency = {route: (median * args.latency_scale, sigma) for route, (median, sigma) in DEFAULT_LATENCY.items()}
+    faults = {"throttle_rate": args.throttle_rate, "captcha_rate": args.captcha_rate, "error_rate": args.error_rate}
+    server = FixtureServer((args.host, args.port), args.properties, latency, faults, args.seed, args.public_url)
+    print(f"Serving Booking fixtures on {server.public_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.summary(), indent=2))
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.dataset as ds
+from benchmarks.bench_transform import RESULTS_DIR, _git_commit
+from etl.warehouse import WAREHOUSE_BACKEND, sql_list, warehouse_session
+
+FACT_TABLE = "BOOKING_DB.ANALYTICS.FACT_PROPERTY_REVIEWS"
+
+
+def dashboard_filters(warehouse):
+    """Typical dashboard filters on the fact: (SQL predicate, matching pyarrow filter on the parquet partitions)"""
+    last_day = warehouse.sql(f"SELECT MAX(scrape_date) FROM {FACT_TABLE}")[0][0]
+    city = warehouse.sql(f"""
+            SELECT l.city FROM {FACT_TABLE} f JOIN BOOKING_DB.ANALYTICS.DIM_LOCATION l ON l.location_sk = f.location_sk
+            GROUP BY l.city ORDER BY COUNT(*) DESC LIMIT 1
+            """)[0][0]
+    # the city filter reaches the fact as the location keys of the city, which the files are partitioned on
+    locations = [row[0] for row in warehouse.sql(
+        f"SELECT location_sk FROM BOOKING_DB.ANALYTICS.DIM_LOCATION WHERE city = {sql_list([city])}")]
+    week_start = last_day - timedelta(days=6)
+
+    day = (f"scrape_date = '{last_day}'", ds.field("scrape_date") == pa.scalar(last_day))
+    week = (f"scrape_date >= '{week_start}'", ds.field("scrape_date") >= pa.scalar(week_start))
+    one_city = (f"location_sk IN ({', '.join(str(sk) for sk in locations)})", ds.field("location_sk").isin(locations))
+    return {
+        "full_scan": ("TRUE", None),
+        "last_day": day,
+        "last_7_days": week,
+        f"city_{city}": one_city,
+        f"city_{city}_last_day": (f"{one_city[0]} AND {day[0]}", one_city[1] & day[1]),
+    }
+
+
+def snowflake_pruning(warehouse, predicate):
+    # compile-time pruning on the clustering key, from the query plan
+    plan = json.loads(warehouse.sql(
+        f"EXPLAIN USING JSON SELECT AVG(weighted_avg), AVG(min_price) FROM {FACT_TABLE} WHERE {predicate}")[0][0])
+    stats = plan["GlobalStats"]
+    return {"partitions_touched": stats["partitionsAssigned"], "partitions_total": stats["partitionsTotal"],
+            "bytes_touched": stats["bytesAssigned"]}
+
+
+def parquet_pruning(dataset, arrow_filter):
+    total = len(list(dataset.get_fragments()))
+    touched = total if arrow_filter is None else len(list(dataset.get_fragments(filter=arrow_filter)))
+    return {"partitions_touched": touched, "partitions_total": total}
+
+
+def report(backend=WAREHOUSE_BACKEND):
+    with warehouse_session(backend) as warehouse:
+        result = {"backend": backend, "filters": {}}
+        if backend == "snowflake":
+            result["clustering"] = json.loads(warehouse.sql(
+                f"SELECT SYSTEM$CLUSTERING_INFORMATION('{FACT_TABLE}')")[0][0])
+        else:
+            # the local backend's parquet copy of the fact, partitioned on the same key
+            dataset = ds.dataset(
+                os.path.join(warehouse.export_dir, "FACT_PROPERTY_REVIEWS"), format="parquet",
+                partitioning=ds.partitioning(pa.schema([("scrape_date", pa.date32()), ("location_sk", pa.int64())]),
+                                             flavor="hive"))
+
+        for name, (predicate, arrow_filter) in dashboard_filters(warehouse).items():
+            start = time.perf_counter()
+            warehouse.sql(f"SELECT AVG(weighted_avg), AVG(min_price) FROM {FACT_TABLE} WHERE {predicate}")
+            entry = {"seconds": time.perf_counter() - start}
+            entry.update(snowflake_pruning(warehouse, predicate) if backend == "snowflake"
+                         else parquet_pruning(dataset, arrow_filter))
+            result["filters"][name] = entry
+    return result
+
+
+def _print_result(result):
+    unit = "micro-partitions" if result["backend"] == "snowflake" else "parquet files"
+    print(f"\nFACT_PROPERTY_REVIEWS pruning on {result['backend']} ({unit} touched):")
+    for name, entry in result["filters"].items():
+        print(f"    {name:<36}{entry['partitions_touched']:>6}/{entry['partitions_total']:<6} {entry['seconds']:.4f}s")
+    if "clustering" in result:
+        print(f"    average clustering depth {result['clustering'].get('average_depth')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="How many partitions typical dashboard filters touch in the fact")
+    parser.add_argument("--backend", default=WAREHOUSE_BACKEND, choices=["snowflake", "duckdb"])
+    args = parser.parse_args()
+
+    result = report(args.backend)
+    _print_result(result)
+
+    commit = _git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"fact_pruning_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(path, "w") as f:
+        json.dump({"commit": commit, "created_at": datetime.now().isoformat(), "result": result}, f, indent=2,
+                  default=str)
+    print(f"\nResults saved to {path}")
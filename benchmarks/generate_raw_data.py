@@ -0,0 +1,179 @@
+import argparse
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from scraper.property_record import FIELDNAMES
+
+# Address fragments shaped like the Nominatim display names the scraper stores
+# (components joined by double spaces, see get_location_details)
+CITIES = {
+    'Marrakech': {
+        'search': 'marrakech',
+        'city_names': ['Marrakesh', 'Marrakesh', 'Marrakesh', 'Mechouar Kasbah', 'Sidi Abdallah Ghiat'],
+        'zones': ['Medina', 'Sidi Abbad', "L'Hivernage", 'Guliz', 'Kasbah', 'Mouassine', 'Sidi Ghanem'],
+        'arrondissements': ['Arrondissement de Marrakech-Medina', 'Arrondissement de Gueliz',
+                            'Arrondissement de Menara', 'Arrondissement de Sidi Youssef Ben Ali'],
+        'suffix': 'Marrakesh  Pachalik de Marrakech  Marrakesh Prefecture  Marrakech-Safi',
+        'postcodes': ['40000', '40010', '40015', '40020', '40030'],
+        'lat': (31.55, 31.70), 'lon': (-8.10, -7.90),
+    },
+    'Tangier': {
+        'search': 'tangier',
+        'city_names': ['Tangier', 'Tangier', 'Tangier', 'Gzenaya'],
+        'zones': ['Medina', 'Malabata', 'Marshan', 'Iberia', 'Boubana', 'Mesnana'],
+        'arrondissements': ['Arrondissement de Tanger-Medina', 'Arrondissement de Charf-Souani',
+                            'Arrondissement de Beni Makada', 'Arrondissement de Charf-Mghogha'],
+        'suffix': 'Tangier  Pachalik de Tanger  Tanger-Assilah Prefecture  Tanger-Tetouan-Al Hoceima',
+        'postcodes': ['90000', '90010', '90020', '90040', '90060'],
+        'lat': (35.70, 35.80), 'lon': (-5.90, -5.75),
+    },
+}
+STREETS = ['Derb Asbane', 'Derb Lalla Aouich', 'Avenue El Qadissia', 'Rue Ibn Batouta',
+           'Boulevard Mohammed V', 'Avenue Pasteur', 'Rue de la Liberte', 'Derb Sidi Bouloukat']
+NAMES = ['riad', 'dar', 'hotel', 'villa', 'kasbah', 'maison', 'palais', 'suites']
+CATEGORIES = ['Hotel', 'Riad', 'Apartment', 'Villa', 'Hostel', 'Guesthouse', 'Apartment-Hotel', 'Holiday home']
+TRAVELER_TYPES = ['families', 'couples', 'solo_travelers', 'business_travellers', 'groups_friends']
+# Booking appends a long per-session label to every property link
+URL_QUERY = ('?aid=304142&label=gen173nr-10CAQoggJCEHNlYXJjaF9{search}IM1gEaIwBiAEBmAEzuAEXyAEM2AED6AEB'
+             '-AEBiAIBqAIBuALJleXFBsACAdICJDQyN2Q1MTQ4LTE1ZjUtNGRlZi04NzlkLTc1ZjczYzViMGM4NNgCAeACAQ'
+             '&ucfs=1&arphpl=1&checkin={checkin}&checkout={checkout}&group_adults=1&req_adults=1&no_rooms=1'
+             '&group_children=0&req_children=0&hpos={hpos}&hapos={hpos}&sr_order=popularity&srpvid={srpvid}'
+             '&srepoch={epoch}&from=searchresults')
+
+
+def _property_pool(n_properties, rng):
+    """Static attributes of the simulated properties (url, location, category)"""
+    city_names = list(CITIES)
+    cities = rng.choice(len(city_names), n_properties)
+    pool = []
+    for i in range(n_properties):
+        city = CITIES[city_names[cities[i]]]
+        zone = city['zones'][rng.integers(len(city['zones']))]
+        address = '  '.join([
+            f"{NAMES[rng.integers(len(NAMES))].title()} {i}",
+            f"{rng.integers(1, 200)}",
+            STREETS[rng.integers(len(STREETS))],
+            zone,
+            city['arrondissements'][rng.integers(len(city['arrondissements']))],
+            '  ' + city['suffix'],
+            city['postcodes'][rng.integers(len(city['postcodes']))],
+            'Morocco',
+        ])
+        pool.append({
+            'slug': f"{NAMES[rng.integers(len(NAMES))]}-{city['search']}-{i}",
+            'search': city['search'],
+            'category': CATEGORIES[rng.integers(len(CATEGORIES))],
+            'address': address,
+            'zone': zone,
+            'city': city['city_names'][rng.integers(len(city['city_names']))],
+            'latitude': rng.uniform(*city['lat']),
+            'longitude': rng.uniform(*city['lon']),
+            'base_price': int(rng.lognormal(6, 0.8)),
+        })
+    return pd.DataFrame(pool)
+
+
+def generate_frame(n_rows, scrape_start, rng, n_properties=None, duplicate_rate=0.05,
+                   missing_zone_rate=0.2, invalid_rate=0.1):
+    """Build n_rows raw scrape rows with the scraper's column set"""
+    n_properties = n_properties or max(1, n_rows // 4)
+    pool = _property_pool(n_properties, rng)
+
+    n_unique = n_rows - int(n_rows * duplicate_rate)
+    picks = rng.integers(0, n_properties, n_unique)
+    props = pool.iloc[picks].reset_index(drop=True)
+
+    # one scrape every ~30s, like scrape_single_threaded
+    offsets = np.sort(rng.integers(0, max(n_unique, 1) * 30, n_unique))
+    scrape_ts = pd.to_datetime(scrape_start) + pd.to_timedelta(offsets, unit='s')
+    checkin = scrape_ts.strftime('%Y-%m-%d')
+    checkout = (scrape_ts + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    df = pd.DataFrame({
+        'property_id': [str(uuid.UUID(int=int(x))) for x in rng.integers(0, 2 ** 63, n_unique)],
+        'scrape_timestamp': scrape_ts.strftime('%Y-%m-%d %H:%M:%S'),
+        'property_url': [
+            f"https://www.booking.com/hotel/ma/{slug}.html" + URL_QUERY.format(
+                search=search, checkin=ci, checkout=co, hpos=hpos, srpvid=uuid.UUID(int=int(r)).hex[:16],
+                epoch=int(ts.timestamp()))
+            for slug, search, ci, co, hpos, r, ts in zip(
+                props.slug, props.search, checkin, checkout, rng.integers(1, 26, n_unique),
+                rng.integers(0, 2 ** 63, n_unique), scrape_ts)
+        ],
+        'category': props.category,
+    })
+
+    counts = {t: rng.poisson(rng.choice([5, 40, 120]), n_unique) for t in TRAVELER_TYPES}
+    scores = {t: np.round(rng.uniform(4, 10, n_unique), 6) for t in TRAVELER_TYPES}
+    for t in TRAVELER_TYPES:
+        # the scraper leaves score/count at 0 when a traveler type has no review
+        scores[t][counts[t] == 0] = 0.0
+    total_count = sum(counts.values())
+    total_score = sum(scores[t] * counts[t] for t in TRAVELER_TYPES)
+
+    df['general_review'] = np.round(rng.uniform(5, 10, n_unique), 1)
+    df['general_review_count'] = total_count * rng.integers(1, 10, n_unique)
+    for column in ['comfort_score', 'value_score', 'location_score', 'wifi_score']:
+        df[column] = np.round(rng.uniform(5, 10, n_unique), 1)
+    df['avg_review_score_all'] = np.where(total_count > 0, total_score / np.maximum(total_count, 1), 0.0)
+    df['avg_review_score_all_count'] = total_count
+    for t in TRAVELER_TYPES:
+        df[f'avg_review_score_{t}'] = scores[t]
+        df[f'avg_review_score_{t}_count'] = counts[t]
+
+    spread = rng.uniform(1, 3, n_unique)
+    df['min_price'] = props.base_price.to_numpy()
+    df['max_price'] = (props.base_price.to_numpy() * spread).astype(int)
+    df['latitude'] = props.latitude.to_numpy()
+    df['longitude'] = props.longitude.to_numpy()
+    df['address'] = props.address.to_numpy()
+    df['zone'] = props.zone.where(rng.random(n_unique) >= missing_zone_rate).to_numpy()
+    df['city'] = props.city.to_numpy()
+    df['wifi_speed'] = np.where(rng.random(n_unique) < 0.9, 'Not specified', '50 Mbps')
+
+    # rows the quality rules should reject (failed price / coordinate lookups)
+    invalid = rng.random(n_unique) < invalid_rate
+    df.loc[invalid & (rng.random(n_unique) < 0.5), 'max_price'] = 0
+    df.loc[invalid & (rng.random(n_unique) < 0.5), ['latitude', 'longitude']] = np.nan
+
+    # re-read rows, like the same batch landing twice in data/raw
+    duplicates = df.iloc[rng.integers(0, n_unique, n_rows - n_unique)]
+    df = pd.concat([df, duplicates], ignore_index=True)
+    return df[FIELDNAMES]
+
+
+def generate_raw_files(out_dir, n_rows, n_files=1, seed=0, **kwargs):
+    """Write n_rows split over n_files raw csv files named like the scraper output"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 9, 1, 8, 0, 0)
+    paths = []
+    rows_per_file = -(-n_rows // n_files)
+    for i in range(n_files):
+        n = min(rows_per_file, n_rows - i * rows_per_file)
+        if n <= 0:
+            break
+        scrape_start = start + timedelta(days=i)
+        df = generate_frame(n, scrape_start, rng, **kwargs)
+        path = os.path.join(
+            out_dir, f"booking_properties_single_marrakech-tangier_{scrape_start.strftime('%Y%m%d_%H%M%S')}.csv")
+        df.to_csv(path, index=False)
+        paths.append(path)
+        print(f"Generated {n} rows into {path}")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic raw booking csv files")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--out", default="./data/bench/raw")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--missing-zone-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    generate_raw_files(args.out, args.rows, args.files, args.seed,
+                       duplicate_rate=args.duplicate_rate, missing_zone_rate=args.missing_zone_rate)
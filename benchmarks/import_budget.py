@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from benchmarks.bench_transform import RESULTS_DIR, _git_commit
+
+# third-party packages that cost tens to hundreds of ms to import
+HEAVY_PACKAGES = ["pandas", "pyarrow", "numpy", "duckdb", "snowflake", "selenium", "requests", "prefect"]
+
+# entry module -> (import budget in ms, heavy packages it may load)
+IMPORT_BUDGETS = {
+    "etl": (20, []),
+    "scraper": (20, []),
+    "etl.tracing": (30, []),
+    "etl.warehouse": (60, []),
+    # the loader lists and uploads staging files, pyarrow comes with etl.staging but pandas must not
+    "etl.OLAP_modeling": (400, ["pyarrow", "numpy"]),
+}
+
+# run in a fresh interpreter, so nothing is already imported
+_MEASURE = """
+import importlib, json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+importlib.import_module({module!r})
+ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": ms, "packages": sorted({{m.split(".")[0] for m in set(sys.modules) - before}})}}))
+"""
+
+
+def measure(module, repeats=5):
+    """Median import time of a module over fresh interpreters, and the heavy packages it loaded"""
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, "-c", _MEASURE.format(module=module)], text=True)
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    heavy = sorted(set(runs[0]["packages"]) & set(HEAVY_PACKAGES))
+    return {"ms": statistics.median(run["ms"] for run in runs), "heavy_packages": heavy}
+
+
+def check_budgets(budgets=IMPORT_BUDGETS, repeats=5):
+    results = {}
+    for module, (budget_ms, allowed) in budgets.items():
+        result = measure(module, repeats)
+        unexpected = [package for package in result["heavy_packages"] if package not in allowed]
+        result.update({"budget_ms": budget_ms, "unexpected_packages": unexpected,
+                       "ok": result["ms"] <= budget_ms and not unexpected})
+        results[module] = result
+    return results
+
+
+if __name__ == "__main__":
+    #   python -m benchmarks.import_budget   (exits 1 when a module is over its budget)
+    parser = argparse.ArgumentParser(description="Import time of the stage entry modules against their budgets")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = check_budgets(repeats=args.repeats)
+    print("\nImport time per entry module (median of fresh interpreters):")
+    for module, result in results.items():
+        status = "ok" if result["ok"] else "OVER BUDGET"
+        extra = f"  unexpected: {', '.join(result['unexpected_packages'])}" if result["unexpected_packages"] else ""
+        print(f"    {module:<22}{result['ms']:8.1f} ms / {result['budget_ms']:>4} ms  {status}{extra}")
+
+    commit = _git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"import_budget_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(path, "w") as f:
+        json.dump({"commit": commit, "created_at": datetime.now().isoformat(), "results": results}, f, indent=2)
+    print(f"\nResults saved to {path}")
+    sys.exit(0 if all(result["ok"] for result in results.values()) else 1)
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+from benchmarks.bench_transform import RESULTS_DIR, _git_commit
+from benchmarks.booking_fixture_server import DEFAULT_FAULTS, DEFAULT_LATENCY, start_server
+from etl.tracing import read_trace, trace_run
+
+# fields a fully scraped property has, a property missing one came through a fault degraded
+# (save_to_csv writes missing text fields empty and missing numeric fields 0)
+COMPLETE_TEXT_FIELDS = ["category", "latitude", "zone"]
+COMPLETE_NUMERIC_FIELDS = ["general_review", "min_price"]
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def check_scraper_targets(server, reverse_url):
+    """Raise unless the scraper's search, property and geocoding urls all point at the fixture server"""
+    from scraper import multi_thread_booking_scraper as booking_scraper
+    targets = booking_scraper.build_urls(["Marrakech"]) + [booking_scraper.nominatim_url()]
+    outside = [url for url in targets if not url.startswith((server.public_url, reverse_url))]
+    if outside:
+        raise RuntimeError(f"The scraper would reach {outside}, not the fixture server at {server.public_url}")
+    return targets
+
+
+def run_level(server, destinations, threads, work_dir):
+    """Scrape the fixture with a number of threads; throughput, property latencies and fault recovery"""
+    from scraper.multi_thread_booking_scraper import scrape_booking_properties
+
+    started = time.time()
+    with trace_run(f"scraper_load_{threads}", os.path.join(work_dir, "traces")) as trace_path:
+        start = time.perf_counter()
+        filename = scrape_booking_properties(destinations, num_threads=threads, batch_size=5)
+        seconds = time.perf_counter() - start
+
+    spans = read_trace(trace_path)
+    property_seconds = [s["dur_us"] / 1e6 for s in spans if s["name"] == "scrape_property_data"]
+    rows = pd.read_csv(filename) if filename and os.path.exists(filename) else pd.DataFrame()
+    complete = 0
+    if len(rows):
+        filled = rows[COMPLETE_TEXT_FIELDS].notna().all(axis=1) & (rows[COMPLETE_NUMERIC_FIELDS] > 0).all(axis=1)
+        complete = int(filled.sum())
+    served = server.summary(since=started)
+    faults = sum(count for outcome, count in served["outcomes"].items() if not outcome.endswith(":ok"))
+    return {
+        "threads": threads,
+        "seconds": seconds,
+        "properties": len(rows),
+        "properties_per_minute": len(rows) / seconds * 60 if seconds else 0,
+        "property_seconds": {
+            "p50": _percentile(property_seconds, 50),
+            "p95": _percentile(property_seconds, 95),
+            "p99": _percentile(property_seconds, 99),
+            "max": max(property_seconds, default=None),
+        },
+        "complete_properties": complete,
+        "degraded_properties": len(rows) - complete,
+        "faults_served": faults,
+        "served": served,
+    }
+
+
+def run(thread_levels, destinations, properties, latency_scale, faults, port, public_url, seed=None):
+    latency = {route: (median * latency_scale, sigma) for route, (median, sigma) in DEFAULT_LATENCY.items()}
+    server = start_server(port=port, properties_per_city=properties, latency=latency, faults=faults, seed=seed,
+                          public_url=public_url)
+    work_dir = tempfile.mkdtemp(prefix="scraper_load_")
+    # the scraper reads these whenever it uses them, in this process
+    reverse_url = f"http://localhost:{port}/reverse"
+    os.environ.update({
+        "BOOKING_BASE_URL": server.public_url,
+        "NOMINATIM_URL": reverse_url,
+        "SCRAPER_RESULTS_DIR": work_dir,
+        "SCRAPER_MAX_PROPERTIES": str(properties * len(destinations)),
+    })
+    results = []
+    try:
+        # never load-test the real Booking.com / Nominatim
+        check_scraper_targets(server, reverse_url)
+        for threads in thread_levels:
+            result = run_level(server, destinations, threads, work_dir)
+            _print_result(result)
+            results.append(result)
+    finally:
+        server.shutdown()
+    return {"destinations": destinations, "properties_per_city": properties, "latency": latency, "faults": faults,
+            "levels": results}
+
+
+def _print_result(result):
+    latency = result["property_seconds"]
+    p95 = f"{latency['p95']:.2f}s" if latency["p95"] is not None else "-"
+    print(f"\n{result['threads']:>3} threads: {result['properties']} properties in {result['seconds']:.1f}s "
+          f"= {result['properties_per_minute']:.1f}/min, property p50 {latency['p50'] or 0:.2f}s p95 {p95}")
+    print(f"    {result['faults_served']} faults served, {result['complete_properties']} complete / "
+          f"{result['degraded_properties']} degraded properties")
+
+
+if __name__ == "__main__":
+    # The browser runs on the Selenium grid (SELENIUM_URL), so the fixture must be reachable from it:
+    #   python -m benchmarks.scraper_load_test --threads 1 2 4 8 --public-url http://host.docker.internal:8765
+    parser = argparse.ArgumentParser(description="Scraper throughput against the local Booking fixture server")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--destinations", nargs="+", default=["Marrakech", "Tangier"])
+    parser.add_argument("--properties", type=int, default=20, help="properties per destination")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--throttle-rate", type=float, default=DEFAULT_FAULTS["throttle_rate"])
+    parser.add_argument("--captcha-rate", type=float, default=DEFAULT_FAULTS["captcha_rate"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_FAULTS["error_rate"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--public-url", help="fixture base url as the browser reaches it")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    faults = {"throttle_rate": args.throttle_rate, "captcha_rate": args.captcha_rate, "error_rate": args.error_rate}
+    report = run(args.threads, args.destinations, args.properties, args.latency_scale, faults, args.port,
+                 args.public_url, args.seed)
+
+    commit = _git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"scraper_load_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(path, "w") as f:
+        json.dump({"commit": commit, "created_at": datetime.now().isoformat(), "result": report}, f, indent=2)
+    print(f"\nResults saved to {path}")
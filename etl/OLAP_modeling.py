@@ -1,324 +1,688 @@
-from os import getenv
-from snowflake.snowpark import Session
-from dotenv import load_dotenv
 import os
-
-
-def create_snowflake_session():
-    # Load environment variables from .env file
-    load_dotenv()
-
-    connection_parameters = {
-        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
-        "user": os.getenv("SNOWFLAKE_USER"),
-        "password": os.getenv("SNOWFLAKE_PASSWORD"),
-        "role": os.getenv("SNOWFLAKE_ROLE"),
-        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
-        "database": os.getenv("SNOWFLAKE_DB"),
-        "schema": getenv("SNOWFLAKE_SCHEMA"),
+import time
+from .caching import hash_files
+from .staging import list_staging_files
+from .tracing import span, traced
+from .warehouse import WAREHOUSE_BACKEND, sql_list, warehouse_session, create_snowflake_session
+
+
+# "incremental": only staging partitions not loaded yet are uploaded and appended,
+# "overwrite": the stage is cleared and the whole staging output replaces the table,
+# "append": the partitions are appended next to the files already loaded (streaming micro-batches)
+LOAD_MODE = os.getenv("LOAD_MODE", "incremental")
+
+# one row per staging file loaded into BOOKING_PROPERTIES
+LOADED_STAGING_FILES_DDL = """
+    CREATE TABLE IF NOT EXISTS LOADED_STAGING_FILES (
+        partition_path TEXT,
+        stage_file TEXT,
+        content_hash TEXT,
+        row_count INT,
+        loaded_at TIMESTAMP_NTZ,
+        modeling_attempts INT,
+        modeled_at TIMESTAMP_NTZ
+    )
+"""
+
+
+def staging_partitions(transformed_file_path):
+    """(partition, local file) pairs of a staging output; a flat file is a single partition"""
+    if os.path.isdir(transformed_file_path):
+        return [
+            (os.path.relpath(os.path.dirname(staging_file), transformed_file_path).replace(os.sep, "/"), staging_file)
+            for staging_file in list_staging_files(transformed_file_path)
+        ]
+    return [("flat", transformed_file_path)]
+
+
+def load_overwrite(warehouse, transformed_file_path):
+    # clearing the internal stage variable to not append the new added data into the previously added data
+    warehouse.clear_stage()
+    print("CLEARING THE INTERNAL STAGE @booking_clean_data")
+    # forgetting the load history reloads every partition into a new table
+    warehouse.sql("DROP TABLE IF EXISTS BOOKING_PROPERTIES")
+    warehouse.sql("DELETE FROM LOADED_STAGING_FILES")
+    load_incremental(warehouse, transformed_file_path)
+
+
+def load_incremental(warehouse, transformed_file_path, replace=True, partitions=None):
+    """Upload and append only the staging partitions whose content was never loaded.
+
+    Every loaded file is recorded in LOADED_STAGING_FILES with its content hash.
+    A partition whose content changed since its last load (new scrapes of the
+    same city and day) first has the rows of its previous files deleted, so the
+    cost of a load follows the new data, not the size of the table.
+    With replace=False the previous files are kept: a streaming micro-batch only
+    holds the new scrapes of its partitions. The next full staging output of the
+    partition still replaces them all. partitions limits the load to some
+    partition paths of the output (a backfill loads it a few days at a time).
+    """
+    loaded = {
+        row[0]: row[1] for row in warehouse.sql("""
+                SELECT partition_path, content_hash FROM LOADED_STAGING_FILES
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY partition_path ORDER BY loaded_at DESC) = 1
+                """)
     }
 
-    # create the user session so I can run queries
-    session = Session.builder.configs(connection_parameters).create()
-    return session
-
-
-def loading2snowflake(transformed_file_path):
-
-    session = create_snowflake_session()
-
+    # a partition written by several transforms (one per destination) holds one file per writer
+    selected = partitions
+    partitions = {}
+    for partition, staging_file in staging_partitions(transformed_file_path):
+        if selected is None or partition in selected:
+            partitions.setdefault(partition, []).append(staging_file)
+    with span("hash_staging_files", "io", partitions=len(partitions)) as trace:
+        hashes = {
+            partition: hash_files(staging_files, os.path.dirname(staging_files[0]))
+            for partition, staging_files in partitions.items()
+        }
+        trace["bytes"] = sum(os.path.getsize(f) for staging_files in partitions.values() for f in staging_files)
+    appended = set()
+    if not replace and hashes:
+        # a redelivered micro-batch is skipped, whatever was appended to its partitions since
+        appended = {
+            row[0] for row in warehouse.sql(
+                f"SELECT DISTINCT content_hash FROM LOADED_STAGING_FILES WHERE content_hash IN ({sql_list(hashes.values())})")
+        }
+    new_files = []
+    uploaded = 0
+    for partition, staging_files in partitions.items():
+        content_hash = hashes[partition]
+        if loaded.get(partition) == content_hash or content_hash in appended:
+            continue
+        uploaded += 1
+        for i, staging_file in enumerate(staging_files):
+            # stage files are named after their content, a retried upload lands on the same name
+            stage_file = f"part-{content_hash}.parquet" if len(staging_files) == 1 else \
+                f"part-{content_hash}-{i}.parquet"
+            warehouse.upload(staging_file, stage_file)
+            new_files.append((partition, stage_file, content_hash))
+    print(f"UPLOADED {uploaded} NEW STAGING PARTITIONS OUT OF {len(partitions)}")
+    if not new_files:
+        return
+
+    # the table is created from the parquet schema on the first load, rows remember their stage file
+    warehouse.create_table_from_file("BOOKING_PROPERTIES", new_files[0][1])
+    warehouse.sql('ALTER TABLE BOOKING_PROPERTIES ADD COLUMN IF NOT EXISTS "_staging_file" TEXT')
+    # staging column added after the table may have been created
+    warehouse.sql('ALTER TABLE BOOKING_PROPERTIES ADD COLUMN IF NOT EXISTS "property_attr_hash" BIGINT')
+
+    warehouse.sql("BEGIN")
     try:
-        #create the resources I will use to load my data
-        session.sql("CREATE WAREHOUSE IF NOT EXISTS BOOKING_WH").collect()
-        session.sql("USE WAREHOUSE BOOKING_WH").collect()
-        session.sql("CREATE DATABASE IF NOT EXISTS BOOKING_DB").collect()
-        session.sql("USE DATABASE BOOKING_DB").collect()
-        session.sql("CREATE SCHEMA IF NOT EXISTS STAGING").collect()
-        session.sql("USE SCHEMA STAGING").collect()
-        session.sql("CREATE STAGE IF NOT EXISTS booking_clean_data").collect()
-        print("created all the necessary ressources : VWH, DB, SCHEMA, STAGING VARIABLE")
-
-        # clearing the internal stage variable to not append the new added data into the previously added data
-        session.sql("REMOVE @booking_clean_data").collect()
-        print("CLEARING THE INTERNAL STAGE @booking_clean_data")
-        # storing the parquet file into an internal stage
-        session.file.put(transformed_file_path,"@booking_clean_data")
-
-        # loading my parquet file into a df, so I can write it into a snowflake table
-        booking_property_df = session.read.parquet("@booking_clean_data")
-        print("READ THE PARQUET FILE CONTENT AND STORE IT INTO A DATAFRAME")
-
-        booking_property_df.write.save_as_table("BOOKING_PROPERTIES", mode="overwrite") # you can use mode="append"
-        print("WROTE THE DATA INTO BOOKING_PROPERTIES SNOWFLAKE TABLE")
-
-        session.sql("""
-                    CREATE OR REPLACE TABLE BOOKING_DB.STAGING.BOOKING_PROPERTIES AS
-                    SELECT *,TO_TIMESTAMP("scrape_timestamp" / 1000) AS normalized_timestamp
-                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES;
-                    """).collect()
-
-    except Exception as e:
-      print(f"error: {e}")
-
-    finally:
-      session.close()
-
-def olap_modeling():
-
-    session = create_snowflake_session()
-
-    session.sql("CREATE SCHEMA IF NOT EXISTS ANALYTICS").collect()
-    session.sql("USE SCHEMA ANALYTICS").collect()
-    session.sql("CREATE SCHEMA IF NOT EXISTS ANALYTICS").collect()
-    session.sql("USE SCHEMA ANALYTICS").collect()
-    print("CREATED ANALYTICS SCHEMA")
-
-    # creating DIM_PROPERTY(property_id, property_url, address, wifi_speed, latittude, longitude)
-    session.sql("""
-                    CREATE TABLE IF NOT EXISTS DIM_PROPERTY (
-                     property_id INT IDENTITY(1,1),
-                     property_url TEXT,
-                     address TEXT,
-                     wifi_speed TEXT,
-                     latitude FLOAT,
-                     longitude FLOAT
-                    )
-                    """).collect()
-    print("CREATED DIM_PROPERTY SUCCESSFULLY ")
-
-    # loading data using merge so the task will be idempotent like no matter how much u run it, it results the same result
-    session.sql("""
-                MERGE INTO DIM_PROPERTY AS TARGET
-                USING (
-                    SELECT 
-                        DISTINCT "property_url", 
-                        "address", 
-                        "wifi_speed", 
-                        "latitude", 
-                        "longitude" 
-                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES
-                
-                ) AS source
-                ON source."property_url" = target.property_url
-                WHEN NOT MATCHED THEN 
-                    INSERT (
-                        property_url, 
-                        address, 
-                        wifi_speed, 
-                        latitude, 
-                        longitude)
-                VALUES(
-                    source."property_url", 
-                    source."address", 
-                    source."wifi_speed", 
-                    source."latitude", 
-                    source."longitude" )
-        """).collect()
-    print("CREATED DIM_PROPERTY SUCCESSFULLY ")
-
-    # creating DIM_CATEGORY(category_id,category)
-    session.sql("""
-                    CREATE TABLE IF NOT EXISTS DIM_CATEGORY (
-                     category_id INT IDENTITY(1,1),
-                     category TEXT
-                    )
-                    """).collect()
-    print("CREATED DIM_CATEGORY SUCCESSFULLY ")
-
-
-    session.sql("""
-                MERGE INTO DIM_CATEGORY AS target
-                USING (
-                    SELECT DISTINCT "category"
-                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES
-                ) AS source
-                ON source."category" = target.category
-                WHEN NOT MATCHED THEN INSERT(category)VALUES(source."category")
-                """).collect()
-    print("LOADED DATA INTO DIM_CATEGORY SUCCESSFULLY ")
-
-
-    # creating DIM_DATE(date_id,scrape_timestamp,day,month,year,weekday)
-    session.sql("""
-                    CREATE TABLE IF NOT EXISTS DIM_DATE (
-                     date_id INT IDENTITY(1,1),
-                     scrape_timestamp TEXT,
-                     day INT,
-                     month INT,
-                     year INT,
-                     weekday INT
-                    )
-                    """).collect()
-    print("CREATED DIM_DATE SUCCESSFULLY ")
-
-
-    session.sql("""
-                MERGE INTO DIM_DATE AS target
-                USING (
-                    SELECT 
-                        "NORMALIZED_TIMESTAMP" AS scrape_timestamp,
-                        DAY("NORMALIZED_TIMESTAMP") AS day,
-                        MONTH("NORMALIZED_TIMESTAMP") AS month,
-                        YEAR("NORMALIZED_TIMESTAMP") AS year,
-                        DAYOFWEEK("NORMALIZED_TIMESTAMP") AS weekday
-                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES 
-                ) AS source
-                ON source.scrape_timestamp = target.scrape_timestamp
-                WHEN NOT MATCHED THEN 
-                INSERT(scrape_timestamp,day,month,year,weekday)
-                VALUES(
-                    source.scrape_timestamp,
-                    source.day,
-                    source.month,
-                    source.year,
-                    source.weekday
-                    )
-                """).collect()
-    print("LOADED DATA INTO DIM_DATE SUCCESSFULLY ")
-
-
-    # creating DIM_LOCATION(location_id,city,zone)
-    session.sql("""
-                    CREATE TABLE IF NOT EXISTS DIM_LOCATION (
-                     location_id INT IDENTITY(1,1),
-                     city TEXT,
-                     zone TEXT
-                    )
-                    """).collect()
-    print("CREATED DIM_LOCATION SUCCESSFULLY ")
-
-    session.sql("""
-                MERGE INTO DIM_LOCATION as target
-                USING (
-                        SELECT 
-                            DISTINCT "city",
-                            "zone",
-                        FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES 
-                ) AS source
-                ON target.city = source."city" AND target.zone = source."zone"
-                WHEN NOT MATCHED THEN
-                    INSERT(
-                        city,
-                        zone
-                    )VALUES(
-                        source."city",
-                        source."zone"
-                    )
-                """).collect()
-    print("LOADED DATA INTO DIM_LOCATION SUCCESSFULLY ")
-
-
-    # creating FACT_PROPERTY_REVIEWSFACT_PROPERTY_REVIEWS(scrape_timestamp, category_id, reviews..., min_price, max_price)
-    session.sql("""
-                    CREATE TABLE IF NOT EXISTS FACT_PROPERTY_REVIEWS (
-                     property_id INT IDENTITY(1,1),
-                     scrape_timestamp TIMESTAMP_NTZ,
-                     category_id INT,
-                     general_review_count FLOAT,
-                     weighted_avg FLOAT,
-                     comfort_score FLOAT,
-                     value_score FLOAT,
-                     location_score FLOAT,
-                     wifi_score FLOAT,
-                     avg_review_score_all FLOAT,
-                     avg_review_score_all_count FLOAT,
-                     avg_review_score_families FLOAT,
-                     avg_review_score_families_count FLOAT,
-                     avg_review_score_couples FLOAT,
-                     avg_review_score_couples_count FLOAT,
-                     avg_review_score_solo_travelers FLOAT,
-                     avg_review_score_solo_travelers_count FLOAT,
-                     avg_review_score_business_travellers FLOAT,
-                     avg_review_score_business_travellers_count FLOAT,
-                     avg_review_score_groups_friends FLOAT,
-                     avg_review_score_groups_friends_count FLOAT,
-                     min_price FLOAT,
-                     max_price FLOAT
-                    )
-                    """).collect()
-    print("CREATED FACT_PROPERTY_REVIEWS SUCCESSFULLY ")
-
-
-    session.sql("""
-               MERGE INTO FACT_PROPERTY_REVIEWS AS target
-                USING (
-                    SELECT 
-                     bp."NORMALIZED_TIMESTAMP" AS NORMALIZED_TIMESTAMP,
-                     dc.category_id,
-                     bp."general_review_count",
-                     bp."weighted_avg",
-                     bp."comfort_score",
-                     bp."value_score",
-                     bp."location_score",
-                     bp."wifi_score",
-                     bp."avg_review_score_all",
-                     bp."avg_review_score_all_count",
-                     bp."avg_review_score_families",
-                     bp."avg_review_score_families_count",
-                     bp."avg_review_score_couples",
-                     bp."avg_review_score_couples_count",
-                     bp."avg_review_score_solo_travelers",
-                     bp."avg_review_score_solo_travelers_count",
-                     bp."avg_review_score_business_travellers",
-                     bp."avg_review_score_business_travellers_count",
-                     bp."avg_review_score_groups_friends",
-                     bp."avg_review_score_groups_friends_count",
-                     bp."min_price",
-                     bp."max_price"
-                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES bp
-                    JOIN BOOKING_DB.ANALYTICS.DIM_CATEGORY dc
-                    ON bp."category" = dc.category
-                ) as source
-                ON target.SCRAPE_TIMESTAMP = source."NORMALIZED_TIMESTAMP"
-                WHEN NOT MATCHED THEN INSERT (
-                  "SCRAPE_TIMESTAMP",
-                  category_id,
-                  general_review_count,
-                  weighted_avg,
-                  comfort_score,
-                  value_score,
-                  location_score,
-                  wifi_score,
-                  avg_review_score_all,
-                  avg_review_score_all_count,
-                  avg_review_score_families,
-                  avg_review_score_families_count,
-                  avg_review_score_couples,
-                  avg_review_score_couples_count,
-                  avg_review_score_solo_travelers,
-                  avg_review_score_solo_travelers_count,
-                  avg_review_score_business_travellers,
-                  avg_review_score_business_travellers_count,
-                  avg_review_score_groups_friends,
-                  avg_review_score_groups_friends_count,
-                  min_price,
-                  max_price
-                )VALUES(
-                    source."NORMALIZED_TIMESTAMP",
-                    source.category_id,
-                    source."general_review_count",
-                    source."weighted_avg",
-                    source."comfort_score",
-                    source."value_score",
-                    source."location_score",
-                    source."wifi_score",
-                    source."avg_review_score_all",
-                    source."avg_review_score_all_count",
-                    source."avg_review_score_families",
-                    source."avg_review_score_families_count",
-                    source."avg_review_score_couples",
-                    source."avg_review_score_couples_count",
-                    source."avg_review_score_solo_travelers",
-                    source."avg_review_score_solo_travelers_count",
-                    source."avg_review_score_business_travellers",
-                    source."avg_review_score_business_travellers_count",
-                    source."avg_review_score_groups_friends",
-                    source."avg_review_score_groups_friends_count",
-                    source."min_price",
-                    source."max_price"
+        if not loaded:
+            # first incremental load, drop whatever an overwrite load left behind
+            warehouse.sql("DELETE FROM BOOKING_PROPERTIES")
+        replaced = sorted({partition for partition, _, _ in new_files if replace and partition in loaded})
+        if replaced:
+            warehouse.sql(f"""
+                        DELETE FROM BOOKING_PROPERTIES
+                        WHERE "_staging_file" IN (
+                            SELECT stage_file FROM LOADED_STAGING_FILES WHERE partition_path IN ({sql_list(replaced)})
+                        )
+                        """)
+            print(f"REPLACING {len(replaced)} CHANGED STAGING PARTITIONS")
+
+        rows_loaded = warehouse.copy_files(
+            "BOOKING_PROPERTIES", [stage_file for _, stage_file, _ in new_files], "_staging_file")
+
+        values = ", ".join(
+            f"({sql_list([partition, stage_file, content_hash])}, {int(rows_loaded.get(stage_file, 0))}, CURRENT_TIMESTAMP)"
+            for partition, stage_file, content_hash in new_files
+        )
+        warehouse.sql(
+            f"INSERT INTO LOADED_STAGING_FILES (partition_path, stage_file, content_hash, row_count, loaded_at) VALUES {values}")
+        warehouse.sql("COMMIT")
+    except Exception:
+        warehouse.sql("ROLLBACK")
+        raise
+    print(f"APPENDED {sum(rows_loaded.values())} ROWS INTO BOOKING_PROPERTIES")
+
+
+@traced("loading2snowflake", "load")
+def loading2snowflake(transformed_file_path, mode=LOAD_MODE, backend=WAREHOUSE_BACKEND, partitions=None):
+
+    with warehouse_session(backend) as warehouse:
+        try:
+            #create the resources I will use to load my data, in a single round trip
+            warehouse.run_script(
+                warehouse.setup_statements() + warehouse.schema_statements("STAGING") +
+                warehouse.stage_statements() + [
+                    LOADED_STAGING_FILES_DDL,
+                    "ALTER TABLE LOADED_STAGING_FILES ADD COLUMN IF NOT EXISTS modeled_at TIMESTAMP_NTZ",
+                    "ALTER TABLE LOADED_STAGING_FILES ADD COLUMN IF NOT EXISTS modeling_attempts INT",
+                ]
+            )
+            print("created all the necessary ressources : VWH, DB, SCHEMA, STAGING VARIABLE")
+
+            if mode == "overwrite":
+                load_overwrite(warehouse, transformed_file_path)
+            else:
+                load_incremental(warehouse, transformed_file_path, replace=mode != "append", partitions=partitions)
+
+        except Exception as e:
+          print(f"error: {e}")
+          # let the task fail, a swallowed error would be cached as a successful load
+          raise
+
+
+# the distinct new staging rows of a modeling run, materialised once and read by every MERGE
+MODELING_BATCH = "BOOKING_DB.STAGING.MODELING_BATCH"
+
+# Dimension members are keyed by the hashes computed in transform (etl/keys.py),
+# the MERGEs only compare integers and insert the members not seen yet
+DIMENSION_MERGES = {
+    # type 2: a property whose attribute hash changed has its current version
+    # expired (matched branch) and a new version inserted (the NULL merge key
+    # branch never matches); unchanged properties only cost one integer comparison
+    "DIM_PROPERTY": f"""
+        MERGE INTO DIM_PROPERTY AS target
+        USING (
+            WITH latest AS (
+                SELECT
+                    "property_sk" AS property_sk,
+                    "property_url" AS property_url,
+                    "address" AS address,
+                    "wifi_speed" AS wifi_speed,
+                    "latitude" AS latitude,
+                    "longitude" AS longitude,
+                    "property_attr_hash" AS attr_hash,
+                    "normalized_timestamp"::TIMESTAMP_NTZ AS valid_from
+                FROM {MODELING_BATCH}
+                -- latest attributes when a property was scraped more than once
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY "property_sk" ORDER BY "normalized_timestamp" DESC) = 1
+            )
+            SELECT property_sk AS merge_sk, * FROM latest
+            UNION ALL
+            SELECT NULL, latest.* FROM latest
+            JOIN DIM_PROPERTY cur_version ON cur_version.property_sk = latest.property_sk AND cur_version.is_current
+            WHERE cur_version.attr_hash IS DISTINCT FROM latest.attr_hash
+              AND (cur_version.valid_from IS NULL OR latest.valid_from > cur_version.valid_from)
+        ) AS source
+        ON target.property_sk = source.merge_sk AND target.is_current
+        WHEN MATCHED AND target.attr_hash IS DISTINCT FROM source.attr_hash
+              AND (target.valid_from IS NULL OR source.valid_from > target.valid_from) THEN
+            UPDATE SET valid_to = source.valid_from, is_current = FALSE
+        WHEN NOT MATCHED THEN
+            INSERT (
+                property_sk,
+                property_url,
+                address,
+                wifi_speed,
+                latitude,
+                longitude,
+                attr_hash,
+                valid_from,
+                valid_to,
+                is_current)
+        VALUES(
+            source.property_sk,
+            source.property_url,
+            source.address,
+            source.wifi_speed,
+            source.latitude,
+            source.longitude,
+            source.attr_hash,
+            source.valid_from,
+            NULL,
+            TRUE )
+    """,
+    "DIM_CATEGORY": f"""
+        MERGE INTO DIM_CATEGORY AS target
+        USING (
+            SELECT DISTINCT "category_sk", "category"
+            FROM {MODELING_BATCH}
+        ) AS source
+        ON source."category_sk" = target.category_sk
+        WHEN NOT MATCHED THEN INSERT(category_sk, category)VALUES(source."category_sk", source."category")
+    """,
+    "DIM_DATE": f"""
+        MERGE INTO DIM_DATE AS target
+        USING (
+            SELECT DISTINCT
+                "date_sk",
+                "normalized_timestamp"::TIMESTAMP_NTZ AS scrape_timestamp,
+                DAY("normalized_timestamp") AS day,
+                MONTH("normalized_timestamp") AS month,
+                YEAR("normalized_timestamp") AS year,
+                DAYOFWEEK("normalized_timestamp") AS weekday
+            FROM {MODELING_BATCH}
+        ) AS source
+        ON source."date_sk" = target.date_sk
+        WHEN NOT MATCHED THEN
+        INSERT(date_sk,scrape_timestamp,day,month,year,weekday)
+        VALUES(
+            source."date_sk",
+            source.scrape_timestamp,
+            source.day,
+            source.month,
+            source.year,
+            source.weekday
+            )
+    """,
+    "DIM_LOCATION": f"""
+        MERGE INTO DIM_LOCATION as target
+        USING (
+                SELECT
+                    DISTINCT "location_sk",
+                    "city",
+                    "zone",
+                FROM {MODELING_BATCH}
+        ) AS source
+        ON source."location_sk" = target.location_sk
+        WHEN NOT MATCHED THEN
+            INSERT(
+                location_sk,
+                city,
+                zone
+            )VALUES(
+                source."location_sk",
+                source."city",
+                source."zone"
+            )
+    """
+}
+
+# the fact rows already carry every dimension key: a plain append, no lookup joins
+# Facts are laid out by scrape day and location, the filters of every dashboard:
+# the Snowflake clustering key, the insert order, and the local parquet partitions
+FACT_CLUSTER_KEY = ["scrape_date", "location_sk"]
+
+FACT_INSERT = f"""
+    INSERT INTO FACT_PROPERTY_REVIEWS (
+        review_sk,
+        property_sk,
+        category_sk,
+        location_sk,
+        date_sk,
+        scrape_date,
+        scrape_timestamp,
+        general_review_count,
+        weighted_avg,
+        comfort_score,
+        value_score,
+        location_score,
+        wifi_score,
+        avg_review_score_all,
+        avg_review_score_all_count,
+        avg_review_score_families,
+        avg_review_score_families_count,
+        avg_review_score_couples,
+        avg_review_score_couples_count,
+        avg_review_score_solo_travelers,
+        avg_review_score_solo_travelers_count,
+        avg_review_score_business_travellers,
+        avg_review_score_business_travellers_count,
+        avg_review_score_groups_friends,
+        avg_review_score_groups_friends_count,
+        min_price,
+        max_price
+    )
+    SELECT
+        "review_sk",
+        "property_sk",
+        "category_sk",
+        "location_sk",
+        "date_sk",
+        "normalized_timestamp"::TIMESTAMP_NTZ::DATE,
+        "normalized_timestamp"::TIMESTAMP_NTZ,
+        "general_review_count",
+        "weighted_avg",
+        "comfort_score",
+        "value_score",
+        "location_score",
+        "wifi_score",
+        "avg_review_score_all",
+        "avg_review_score_all_count",
+        "avg_review_score_families",
+        "avg_review_score_families_count",
+        "avg_review_score_couples",
+        "avg_review_score_couples_count",
+        "avg_review_score_solo_travelers",
+        "avg_review_score_solo_travelers_count",
+        "avg_review_score_business_travellers",
+        "avg_review_score_business_travellers_count",
+        "avg_review_score_groups_friends",
+        "avg_review_score_groups_friends_count",
+        "min_price",
+        "max_price"
+    FROM {MODELING_BATCH}
+    ORDER BY "normalized_timestamp"::TIMESTAMP_NTZ::DATE, "location_sk"
+"""
+
+# (scrape_date, location_sk) partitions of the fact touched by the modeling batch
+FACT_BATCH_PARTITIONS = f"""
+    SELECT DISTINCT "normalized_timestamp"::TIMESTAMP_NTZ::DATE AS scrape_date, "location_sk" AS location_sk
+    FROM {MODELING_BATCH}
+"""
+
+# staging rows reloaded from a changed partition replace their previous facts
+FACT_DELETE_RELOADED = f"""
+    DELETE FROM FACT_PROPERTY_REVIEWS
+    WHERE review_sk IN (SELECT "review_sk" FROM {MODELING_BATCH})
+"""
+
+
+# Dashboard rollup at city x zone x category x day. Only sums and counts are
+# stored, so a batch of facts is added (or a replaced one subtracted) with one
+# MERGE, and averages at any coarser grain are sum / count.
+ROLLUP_TABLE = "AGG_REVIEWS_DAILY"
+ROLLUP_MEASURES = ["weighted_avg", "general_review_count", "min_price", "max_price"]
+ROLLUP_KEY = ["location_sk", "category_sk", "scrape_date"]
+ROLLUP_COUNTERS = ["review_rows"] + [f"{m}_{part}" for m in ROLLUP_MEASURES for part in ("sum", "count")]
+ROLLUP_COLUMNS = ROLLUP_KEY + ["city", "zone", "category"] + ROLLUP_COUNTERS
+
+
+def _rollup_select(source, timestamp):
+    """Sums and counts of a set of fact rows per rollup key"""
+    aggregates = ",\n".join(
+        f"            COALESCE(SUM({m}), 0) AS {m}_sum,\n            COUNT({m}) AS {m}_count" for m in ROLLUP_MEASURES)
+    return f"""
+        SELECT
+            location_sk,
+            category_sk,
+            {timestamp}::TIMESTAMP_NTZ::DATE AS scrape_date,
+            ANY_VALUE(city) AS city,
+            ANY_VALUE(zone) AS zone,
+            ANY_VALUE(category) AS category,
+            COUNT(*) AS review_rows,
+{aggregates}
+        FROM {source}
+        GROUP BY 1, 2, 3
+    """
+
+
+def rollup_merge(source, timestamp, sign="+"):
+    """MERGE adding (sign '+') or subtracting (sign '-') fact rows into the rollup"""
+    updates = ", ".join(f"{c} = target.{c} {sign} source.{c}" for c in ROLLUP_COUNTERS)
+    merge = f"""
+        MERGE INTO {ROLLUP_TABLE} AS target
+        USING ({_rollup_select(source, timestamp)}) AS source
+        ON target.location_sk = source.location_sk
+           AND target.category_sk = source.category_sk
+           AND target.scrape_date = source.scrape_date
+        WHEN MATCHED THEN UPDATE SET {updates}
+    """
+    if sign == "+":
+        merge += f"""
+        WHEN NOT MATCHED THEN INSERT ({", ".join(ROLLUP_COLUMNS)})
+        VALUES ({", ".join("source." + c for c in ROLLUP_COLUMNS)})
+    """
+    return merge
+
+
+# the new facts, straight from the modeling batch
+ROLLUP_ADD_BATCH = rollup_merge(f"""(
+        SELECT "location_sk" AS location_sk, "category_sk" AS category_sk, "normalized_timestamp" AS scrape_ts,
+               "city" AS city, "zone" AS zone, "category" AS category,
+               {", ".join(f'"{m}" AS {m}' for m in ROLLUP_MEASURES)}
+        FROM {MODELING_BATCH})""", "scrape_ts")
+
+# facts about to be replaced by reloaded staging rows (the ones FACT_DELETE_RELOADED removes)
+ROLLUP_SUBTRACT_RELOADED = rollup_merge(f"""(
+        SELECT f.*, NULL AS city, NULL AS zone, NULL AS category FROM FACT_PROPERTY_REVIEWS f
+        WHERE review_sk IN (SELECT "review_sk" FROM {MODELING_BATCH}))""", "scrape_timestamp", sign="-")
+
+# one-off fill from the facts already modeled when the rollup is first created
+ROLLUP_BACKFILL = f"INSERT INTO {ROLLUP_TABLE} ({', '.join(ROLLUP_COLUMNS)})" + _rollup_select("""(
+        SELECT f.*, l.city, l.zone, c.category FROM FACT_PROPERTY_REVIEWS f
+        LEFT JOIN DIM_LOCATION l ON l.location_sk = f.location_sk
+        LEFT JOIN DIM_CATEGORY c ON c.category_sk = f.category_sk)""", "scrape_timestamp")
+
+
+def modeling_ddl(warehouse):
+    """Star schema tables, created once and sent to the warehouse in one batch"""
+    statements = []
+    for table in ["DIM_PROPERTY", "DIM_CATEGORY", "DIM_DATE", "DIM_LOCATION", "FACT_PROPERTY_REVIEWS"]:
+        statements += warehouse.identity_statements(table)
+    return statements + [
+        # creating DIM_PROPERTY(property_id, property_url, address, wifi_speed, latittude, longitude)
+        # one row per version of a property: join facts on property_sk AND is_current for
+        # today's attributes, or on scrape_timestamp within [valid_from, valid_to) for history
+        f"""
+            CREATE TABLE IF NOT EXISTS DIM_PROPERTY (
+             property_id {warehouse.identity_column('DIM_PROPERTY')},
+             property_sk BIGINT,
+             property_url TEXT,
+             address TEXT,
+             wifi_speed TEXT,
+             latitude FLOAT,
+             longitude FLOAT,
+             attr_hash BIGINT,
+             valid_from TIMESTAMP_NTZ,
+             valid_to TIMESTAMP_NTZ,
+             is_current BOOLEAN
+            )
+        """,
+        # creating DIM_CATEGORY(category_id,category)
+        f"""
+            CREATE TABLE IF NOT EXISTS DIM_CATEGORY (
+             category_id {warehouse.identity_column('DIM_CATEGORY')},
+             category_sk BIGINT,
+             category TEXT
+            )
+        """,
+        # creating DIM_DATE(date_id,scrape_timestamp,day,month,year,weekday)
+        f"""
+            CREATE TABLE IF NOT EXISTS DIM_DATE (
+             date_id {warehouse.identity_column('DIM_DATE')},
+             date_sk BIGINT,
+             scrape_timestamp TEXT,
+             day INT,
+             month INT,
+             year INT,
+             weekday INT
+            )
+        """,
+        # creating DIM_LOCATION(location_id,city,zone)
+        f"""
+            CREATE TABLE IF NOT EXISTS DIM_LOCATION (
+             location_id {warehouse.identity_column('DIM_LOCATION')},
+             location_sk BIGINT,
+             city TEXT,
+             zone TEXT
+            )
+        """,
+        # creating FACT_PROPERTY_REVIEWS(fact_id, keys, scrape_date, scrape_timestamp, reviews..., min_price, max_price)
+        f"""
+            CREATE TABLE IF NOT EXISTS FACT_PROPERTY_REVIEWS (
+             fact_id {warehouse.identity_column('FACT_PROPERTY_REVIEWS')},
+             review_sk BIGINT,
+             property_sk BIGINT,
+             category_sk BIGINT,
+             location_sk BIGINT,
+             date_sk BIGINT,
+             scrape_date DATE,
+             scrape_timestamp TIMESTAMP_NTZ,
+             general_review_count FLOAT,
+             weighted_avg FLOAT,
+             comfort_score FLOAT,
+             value_score FLOAT,
+             location_score FLOAT,
+             wifi_score FLOAT,
+             avg_review_score_all FLOAT,
+             avg_review_score_all_count FLOAT,
+             avg_review_score_families FLOAT,
+             avg_review_score_families_count FLOAT,
+             avg_review_score_couples FLOAT,
+             avg_review_score_couples_count FLOAT,
+             avg_review_score_solo_travelers FLOAT,
+             avg_review_score_solo_travelers_count FLOAT,
+             avg_review_score_business_travellers FLOAT,
+             avg_review_score_business_travellers_count FLOAT,
+             avg_review_score_groups_friends FLOAT,
+             avg_review_score_groups_friends_count FLOAT,
+             min_price FLOAT,
+             max_price FLOAT
+            )
+        """,
+        # tables created before the hashed surrogate keys
+        "ALTER TABLE DIM_PROPERTY ADD COLUMN IF NOT EXISTS property_sk BIGINT",
+        "ALTER TABLE DIM_PROPERTY ADD COLUMN IF NOT EXISTS attr_hash BIGINT",
+        "ALTER TABLE DIM_PROPERTY ADD COLUMN IF NOT EXISTS valid_from TIMESTAMP_NTZ",
+        "ALTER TABLE DIM_PROPERTY ADD COLUMN IF NOT EXISTS valid_to TIMESTAMP_NTZ",
+        # rows of the type 1 dimension become the current versions
+        "ALTER TABLE DIM_PROPERTY ADD COLUMN IF NOT EXISTS is_current BOOLEAN DEFAULT TRUE",
+        "ALTER TABLE DIM_CATEGORY ADD COLUMN IF NOT EXISTS category_sk BIGINT",
+        "ALTER TABLE DIM_DATE ADD COLUMN IF NOT EXISTS date_sk BIGINT",
+        "ALTER TABLE DIM_LOCATION ADD COLUMN IF NOT EXISTS location_sk BIGINT",
+    ] + [
+        f"ALTER TABLE FACT_PROPERTY_REVIEWS ADD COLUMN IF NOT EXISTS {column} BIGINT"
+        for column in ["review_sk", "property_sk", "category_sk", "location_sk", "date_sk"]
+    ] + [
+        # creating AGG_REVIEWS_DAILY(location_sk, category_sk, scrape_date, city, zone, category, sums and counts)
+        f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+             location_sk BIGINT,
+             category_sk BIGINT,
+             scrape_date DATE,
+             city TEXT,
+             zone TEXT,
+             category TEXT,
+             review_rows BIGINT,
+             {", ".join(f"{m}_sum DOUBLE, {m}_count BIGINT" for m in ROLLUP_MEASURES)}
+            )
+        """,
+        # what the dashboards read: averages from the rollup's sums and counts
+        f"""
+            CREATE OR REPLACE VIEW {ROLLUP_TABLE}_AVG AS
+            SELECT city, zone, category, scrape_date, review_rows,
+             {", ".join(f"{m}_sum / NULLIF({m}_count, 0) AS avg_{m}" for m in ROLLUP_MEASURES)}
+            FROM {ROLLUP_TABLE}
+            WHERE review_rows > 0
+        """,
+    ]
+
+
+def migrate_fact_table(warehouse):
+    """Bring a fact table created by an earlier version to the current layout"""
+    columns = {row[0].lower() for row in warehouse.sql("""
+                SELECT column_name FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE table_catalog = 'BOOKING_DB' AND table_schema = 'ANALYTICS'
+                AND table_name = 'FACT_PROPERTY_REVIEWS'
+                """)}
+    # the identity column numbers fact rows, it never identified a property
+    if "property_id" in columns and "fact_id" not in columns:
+        warehouse.sql("ALTER TABLE FACT_PROPERTY_REVIEWS RENAME COLUMN property_id TO fact_id")
+    if "scrape_date" not in columns:
+        warehouse.sql("ALTER TABLE FACT_PROPERTY_REVIEWS ADD COLUMN scrape_date DATE")
+        warehouse.sql("UPDATE FACT_PROPERTY_REVIEWS SET scrape_date = scrape_timestamp::DATE")
+        print("ADDED scrape_date TO FACT_PROPERTY_REVIEWS")
+
+
+def migrate_property_dimension(warehouse):
+    """Hash the keys of DIM_PROPERTY rows created before the surrogate keys.
+
+    The keys are hashed client-side like in transform, so the SCD2 MERGE
+    matches these rows instead of opening a second current version of
+    every existing property. The attributes are hashed from the property's
+    last modeled staging row: the dimension's own FLOAT coordinates are
+    single precision on DuckDB and would not hash like the staging ones.
+    """
+    if not warehouse.sql("SELECT 1 FROM DIM_PROPERTY WHERE property_sk IS NULL OR attr_hash IS NULL LIMIT 1"):
+        return
+    legacy = warehouse.sql("""
+                WITH modeled AS (
+                    SELECT split_part(s."property_url", '?', 1) AS property_key,
+                           s."address" AS address, s."wifi_speed" AS wifi_speed,
+                           s."latitude" AS latitude, s."longitude" AS longitude
+                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES s
+                    JOIN BOOKING_DB.STAGING.LOADED_STAGING_FILES f
+                    ON f.stage_file = s."_staging_file" AND f.modeled_at IS NOT NULL
+                    QUALIFY ROW_NUMBER() OVER (
+                        PARTITION BY split_part(s."property_url", '?', 1)
+                        ORDER BY s."normalized_timestamp" DESC NULLS LAST, s."scrape_timestamp" DESC) = 1
                 )
-                """).collect()
-    print("LOADED DATA INTO  FACT_PROPERTY_REVIEWS SUCCESSFULLY ")
-
-
-
+                SELECT d.property_id, d.property_url,
+                       CASE WHEN m.property_key IS NULL THEN d.address ELSE m.address END,
+                       CASE WHEN m.property_key IS NULL THEN d.wifi_speed ELSE m.wifi_speed END,
+                       CASE WHEN m.property_key IS NULL THEN d.latitude ELSE m.latitude END,
+                       CASE WHEN m.property_key IS NULL THEN d.longitude ELSE m.longitude END
+                FROM DIM_PROPERTY d
+                LEFT JOIN modeled m ON m.property_key = split_part(d.property_url, '?', 1)
+                WHERE d.property_sk IS NULL OR d.attr_hash IS NULL
+                """)
+    # pandas only comes with a dimension left by an earlier version
+    import pandas as pd
+    from .keys import PROPERTY_ATTRIBUTES, attribute_hash, canonical_property_key, hash64
+
+    rows = pd.DataFrame([tuple(row) for row in legacy], columns=["property_id", "property_url"] + PROPERTY_ATTRIBUTES)
+    rows["latitude"] = rows["latitude"].astype("float64")
+    rows["longitude"] = rows["longitude"].astype("float64")
+    property_sk = hash64(pd.DataFrame({"property_key": canonical_property_key(rows["property_url"])}))
+    attr_hash = attribute_hash(rows)
+    values = ", ".join(
+        f"({int(property_id)}, {int(sk)}, {int(attr)})"
+        for property_id, sk, attr in zip(rows["property_id"], property_sk, attr_hash)
+    )
+    warehouse.sql(f"""
+                UPDATE DIM_PROPERTY SET property_sk = COALESCE(DIM_PROPERTY.property_sk, keys.property_sk),
+                                        attr_hash = COALESCE(DIM_PROPERTY.attr_hash, keys.attr_hash),
+                                        is_current = COALESCE(DIM_PROPERTY.is_current, TRUE)
+                FROM (VALUES {values}) AS keys(property_id, property_sk, attr_hash)
+                WHERE DIM_PROPERTY.property_id = keys.property_id
+                """)
+    print(f"HASHED THE KEYS OF {len(rows)} DIM_PROPERTY ROWS FROM AN EARLIER VERSION")
+
+
+@traced("olap_modeling", "load")
+def olap_modeling(backend=WAREHOUSE_BACKEND):
+    """Model the staging rows not modeled yet into the dimensions and the fact.
+
+    The new rows are materialised once into MODELING_BATCH. They carry every
+    surrogate key, so the dimension MERGEs are independent and run
+    concurrently. The fact append and its rollup delta then run in one
+    transaction. Facts are only deleted first when the batch may hold rows
+    already modeled (a changed partition, a retried run, a reset load history).
+    """
+
+    with warehouse_session(backend) as warehouse:
+        warehouse.run_script(warehouse.setup_statements() + warehouse.schema_statements("ANALYTICS") + modeling_ddl(warehouse))
+        migrate_fact_table(warehouse)
+        migrate_property_dimension(warehouse)
+        warehouse.run_script(warehouse.cluster_statements("FACT_PROPERTY_REVIEWS", FACT_CLUSTER_KEY))
+        print("CREATED ANALYTICS SCHEMA, DIMENSION AND FACT TABLES")
+
+        start = time.perf_counter()
+        new_files = warehouse.sql("""
+                    SELECT n.stage_file, COALESCE(n.modeling_attempts, 0) > 0 OR COUNT(o.stage_file) > 0
+                    FROM BOOKING_DB.STAGING.LOADED_STAGING_FILES n
+                    LEFT JOIN BOOKING_DB.STAGING.LOADED_STAGING_FILES o
+                    ON o.partition_path = n.partition_path AND o.modeled_at IS NOT NULL
+                    WHERE n.modeled_at IS NULL
+                    GROUP BY n.stage_file, n.modeling_attempts
+                    """)
+        if not new_files:
+            print("NO NEW STAGING ROWS TO MODEL")
+            return
+        if not warehouse.sql(f"SELECT 1 FROM {ROLLUP_TABLE} LIMIT 1"):
+            warehouse.sql(ROLLUP_BACKFILL)
+        first_model = not warehouse.sql(
+            "SELECT 1 FROM BOOKING_DB.STAGING.LOADED_STAGING_FILES WHERE modeled_at IS NOT NULL LIMIT 1")
+        reloaded = first_model or any(row[1] for row in new_files)
+        new_files = [row[0] for row in new_files]
+
+        warehouse.sql(f"""
+                    CREATE OR REPLACE {warehouse.temporary_table} {MODELING_BATCH} AS
+                    SELECT DISTINCT * EXCLUDE ("_staging_file")
+                    FROM BOOKING_DB.STAGING.BOOKING_PROPERTIES
+                    WHERE "_staging_file" IN ({sql_list(new_files)})
+                    """)
+        batch_rows = warehouse.sql(f"SELECT COUNT(*) FROM {MODELING_BATCH}")[0][0]
+        warehouse.sql(f"""
+                    UPDATE BOOKING_DB.STAGING.LOADED_STAGING_FILES
+                    SET modeling_attempts = COALESCE(modeling_attempts, 0) + 1
+                    WHERE stage_file IN ({sql_list(new_files)})
+                    """)
+
+        # dimension MERGEs are idempotent, a retry simply merges the same members again
+        warehouse.run_concurrently(list(DIMENSION_MERGES.values()))
+        # the fact rows and their rollup delta change together or not at all, so a
+        # failed run leaves the rollup matching the facts and its retry starts clean
+        fact_changes = [ROLLUP_SUBTRACT_RELOADED, FACT_DELETE_RELOADED] if reloaded else []
+        warehouse.run_transaction(fact_changes + [FACT_INSERT, ROLLUP_ADD_BATCH, f"""
+                    UPDATE BOOKING_DB.STAGING.LOADED_STAGING_FILES SET modeled_at = CURRENT_TIMESTAMP
+                    WHERE stage_file IN ({sql_list(new_files)})
+                    """])
+        print(f"LOADED DATA INTO {', '.join(DIMENSION_MERGES)}, FACT_PROPERTY_REVIEWS, {ROLLUP_TABLE} SUCCESSFULLY ")
+        warehouse.export_partitions("FACT_PROPERTY_REVIEWS", FACT_CLUSTER_KEY, FACT_BATCH_PARTITIONS)
+        warehouse.sql(f"DROP TABLE IF EXISTS {MODELING_BATCH}")
+        print(f"MODELED {batch_rows} NEW STAGING ROWS IN {time.perf_counter() - start:.3f}s")
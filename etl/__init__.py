@@ -1,3 +1,36 @@
-from .transform import transform
-from .OLAP_modeling import loading2snowflake
-from .OLAP_modeling import olap_modeling
+import importlib
+import sys
+import types
+
+# public functions -> submodule defining them, imported on first access (PEP 562),
+# so `import etl.tracing` or a loader-only worker does not pay for pandas / pyarrow
+_LAZY_ATTRIBUTES = {
+    "transform": ".transform",
+    "loading2snowflake": ".OLAP_modeling",
+    "olap_modeling": ".OLAP_modeling",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # importing the etl.transform submodule binds it on the package, etl.transform stays the function
+        if name in _LAZY_ATTRIBUTES and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
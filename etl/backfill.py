@@ -0,0 +1,155 @@
+import argparse
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from .OLAP_modeling import loading2snowflake, olap_modeling, staging_partitions
+from .staging import staging_path
+from .tracing import span, trace_run
+from .transform import (RAW_DATA_DIR, RAW_SNAPSHOT_FILE, TRANSFORM_ENGINE, list_raw_files, raw_file_date,
+                        staging_timestamp, transform)
+from .warehouse import WAREHOUSE_BACKEND, warehouse_session
+
+# raw file days transformed at once, each transform is a thread of the backfill
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+# scrape days of the rebuilt staging output loaded and modeled per checkpoint
+BACKFILL_LOAD_DAYS = int(os.getenv("BACKFILL_LOAD_DAYS", "7"))
+BACKFILL_CHECKPOINT = os.getenv("BACKFILL_CHECKPOINT", "./data/backfill/checkpoint.json")
+# raw files whose name carries no scrape day are transformed together
+UNDATED = "undated"
+
+
+def raw_files_by_date(data_src_dir=RAW_DATA_DIR):
+    """Every raw file of the history (not the raw snapshot, a union of them) grouped by scrape day"""
+    days = {}
+    for file_path in list_raw_files(data_src_dir):
+        if os.path.basename(file_path) != RAW_SNAPSHOT_FILE:
+            days.setdefault(raw_file_date(file_path) or UNDATED, []).append(file_path)
+    return days
+
+
+def read_checkpoint(path=BACKFILL_CHECKPOINT):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(checkpoint, path=BACKFILL_CHECKPOINT):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def reset_warehouse(warehouse):
+    # the staging table and the star schema are rebuilt from the new staging output
+    warehouse.run_script(warehouse.setup_statements() + [
+        "DROP SCHEMA IF EXISTS BOOKING_DB.STAGING CASCADE",
+        "DROP SCHEMA IF EXISTS BOOKING_DB.ANALYTICS CASCADE",
+    ])
+    warehouse.clear_exports()
+    print("DROPPED THE STAGING AND ANALYTICS SCHEMAS FOR THE REBUILD")
+
+
+def transform_history(checkpoint, concurrency, engine, checkpoint_path):
+    """Transform the raw files of every day not done yet into the rebuild's staging output, in parallel"""
+    days = raw_files_by_date()
+    pending = [day for day in sorted(days) if day not in checkpoint["transformed"]]
+    print(f"🗓️ Transforming {len(pending)} of {len(days)} raw file days, {concurrency} at a time")
+
+    def transform_day(day):
+        with span("backfill_transform_day", "backfill", day=day, files=len(days[day])):
+            # the part name is the day, so a day transformed again after a crash overwrites its own files
+            transform(files=days[day], engine=engine, layout="partitioned",
+                      output_path=checkpoint["staging_output"], part_name=f"part-{day}")
+        return day
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # each day runs in a copy of the caller's context, its span nests under the backfill's
+        futures = [pool.submit(contextvars.copy_context().run, transform_day, day) for day in pending]
+        for future in as_completed(futures):
+            # checkpointed from this thread only, as each day completes
+            checkpoint["transformed"].append(future.result())
+            write_checkpoint(checkpoint, checkpoint_path)
+
+
+def load_history(checkpoint, load_days, backend, checkpoint_path):
+    """Load and model the rebuilt staging output a few scrape days at a time, oldest first"""
+    output = checkpoint["staging_output"]
+    if not os.path.isdir(output):
+        print("🗓️ No staging rows to load")
+        return
+    partitions_by_day = {}
+    for partition, _ in staging_partitions(output):
+        day = partition.rsplit("scrape_date=", 1)[-1]
+        partitions_by_day.setdefault(day, set()).add(partition)
+    pending = [day for day in sorted(partitions_by_day) if day not in checkpoint["loaded"]]
+
+    with warehouse_session(backend) as warehouse:
+        if not checkpoint["reset"]:
+            reset_warehouse(warehouse)
+            checkpoint["reset"] = True
+            write_checkpoint(checkpoint, checkpoint_path)
+        for i in range(0, len(pending), load_days):
+            batch = pending[i:i + load_days]
+            print(f"🗓️ Loading scrape days {batch[0]} to {batch[-1]} ({i + len(batch)}/{len(pending)})")
+            with span("backfill_load_days", "backfill", days=batch):
+                partitions = set().union(*(partitions_by_day[day] for day in batch))
+                # a batch interrupted before its checkpoint is loaded again: the loaded
+                # files are skipped by their content hash and the modeling picks up the rest
+                loading2snowflake(output, mode="incremental", backend=backend, partitions=partitions)
+                olap_modeling(backend)
+            checkpoint["loaded"].extend(batch)
+            write_checkpoint(checkpoint, checkpoint_path)
+
+
+def backfill(concurrency=BACKFILL_CONCURRENCY, load_days=BACKFILL_LOAD_DAYS, restart=False, engine=TRANSFORM_ENGINE,
+             backend=WAREHOUSE_BACKEND, checkpoint_path=BACKFILL_CHECKPOINT):
+    """Rebuild a staging output and the star schema from every raw file of the history.
+
+    The raw files are transformed per scrape day, several days at a time, into
+    one new partitioned staging output. The warehouse schemas are then dropped
+    and the output is loaded and modeled day batch by day batch. Progress is
+    checkpointed after every day transformed and every batch loaded, so an
+    interrupted backfill resumes where it stopped unless restart is set.
+    """
+    checkpoint = None if restart else read_checkpoint(checkpoint_path)
+    if checkpoint and checkpoint.get("completed_at"):
+        checkpoint = None
+    if checkpoint:
+        print(f"🗓️ Resuming the backfill started at {checkpoint['started_at']} into {checkpoint['staging_output']}")
+    else:
+        checkpoint = {
+            "started_at": datetime.now().isoformat(),
+            "staging_output": staging_path(staging_timestamp(), layout="partitioned"),
+            "transformed": [],
+            "reset": False,
+            "loaded": [],
+        }
+        write_checkpoint(checkpoint, checkpoint_path)
+
+    transform_history(checkpoint, concurrency, engine, checkpoint_path)
+    load_history(checkpoint, load_days, backend, checkpoint_path)
+    checkpoint["completed_at"] = datetime.now().isoformat()
+    write_checkpoint(checkpoint, checkpoint_path)
+    print(f"✅ Backfill complete: {len(checkpoint['transformed'])} raw file days, "
+          f"{len(checkpoint['loaded'])} scrape days loaded from {checkpoint['staging_output']}")
+    return checkpoint["staging_output"]
+
+
+if __name__ == "__main__":
+    #   python -m etl.backfill --concurrency 8          (resumes an interrupted backfill)
+    #   python -m etl.backfill --restart                (starts over from the raw files)
+    parser = argparse.ArgumentParser(description="Rebuild staging and the star schema from the raw file history")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument("--load-days", type=int, default=BACKFILL_LOAD_DAYS)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an interrupted backfill")
+    parser.add_argument("--engine", default=TRANSFORM_ENGINE, choices=["pandas", "duckdb"])
+    parser.add_argument("--backend", default=WAREHOUSE_BACKEND, choices=["snowflake", "duckdb"])
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT)
+    args = parser.parse_args()
+
+    with trace_run("backfill"):
+        backfill(args.concurrency, args.load_days, args.restart, args.engine, args.backend, args.checkpoint)
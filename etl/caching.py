@@ -0,0 +1,63 @@
+import hashlib
+import os
+from datetime import timedelta
+from .staging import list_staging_files
+
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# How long a cached transform / load stays valid, and a switch to ignore the cache
+CACHE_EXPIRATION = timedelta(hours=float(os.getenv("ETL_CACHE_EXPIRATION_HOURS", "24")))
+FORCE_REFRESH = os.getenv("ETL_FORCE_REFRESH", "false").lower() in ("1", "true", "yes")
+
+# source files whose changes must invalidate a cached stage
+TRANSFORM_CODE = ["transform.py", "keys.py", "quality.py", "staging.py", "duckdb_engine.py"]
+LOAD_CODE = ["OLAP_modeling.py", "staging.py", "warehouse.py"]
+# settings read from the environment that change the transform output
+TRANSFORM_SETTINGS = ["TRANSFORM_ENGINE", "STAGING_LAYOUT", "STAGING_ROW_GROUP_SIZE"]
+LOAD_SETTINGS = ["LOAD_MODE", "WAREHOUSE_BACKEND", "LOCAL_WAREHOUSE_PATH"]
+
+
+def _settings_hash(names):
+    settings = ";".join(f"{name}={os.getenv(name, '')}" for name in names)
+    return hashlib.blake2b(settings.encode(), digest_size=8).hexdigest()
+
+
+def hash_files(paths, root=None):
+    """Content hash of a list of files: names (relative to root) and bytes, not mtimes"""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        digest.update((os.path.relpath(path, root) if root else os.path.basename(path)).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(files):
+    return hash_files([os.path.join(ETL_DIR, file) for file in files])
+
+
+def transform_cache_key(context, parameters):
+    """Key of one transform task: its raw files + the transform code and settings"""
+    # the transform module brings pandas, the loader only needs hash_files from here
+    from .transform import destination_raw_files, destination_slug, other_raw_files
+
+    if "destination" in parameters:
+        part = destination_slug(parameters["destination"])
+        raw_files = destination_raw_files(parameters["destination"])
+    else:
+        # raw_booking.csv is rewritten by every full transform, other_raw_files leaves it out
+        part = "other"
+        raw_files = other_raw_files(parameters["destinations"])
+    return f"transform-{part}-" + hash_files(raw_files) + "-" + code_version(TRANSFORM_CODE) + "-" + \
+        _settings_hash(TRANSFORM_SETTINGS)
+
+
+def load_cache_key(context, parameters):
+    transformed_file = parameters["transformed_file"]
+    # the flow hands over the container path, read the files relative to the working dir when needed
+    local_path = transformed_file if os.path.exists(transformed_file) else \
+        transformed_file.replace("/opt/prefect/", "./", 1)
+    root = local_path if os.path.isdir(local_path) else None
+    return "load-" + hash_files(list_staging_files(local_path), root) + "-" + code_version(LOAD_CODE) + "-" + \
+        _settings_hash(LOAD_SETTINGS)
@@ -0,0 +1,187 @@
+import os
+import pyarrow.parquet as pq
+from .keys import add_surrogate_keys, update_key_maps
+from .quality import QUALITY_RULES, write_quarantine
+from .staging import STAGING_LAYOUT, staging_path, write_staging_dataset
+from .tracing import span
+
+# Same zone identifiers / region indicators as transform.get_zone_from_address
+ZONE_IDENTIFIERS = ['Cercle d', 'Prefecture d', 'Province d', 'Arrondissement d', 'cadat d', 'Pachalik d', 'Commune d']
+REGION_INDICATORS = ['Marrakesh', 'Province', 'Prefecture']
+
+TRAVELER_TYPES = ['families', 'couples', 'solo_travelers', 'business_travellers', 'groups_friends']
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def rule_predicate(rule):
+    """SQL predicate that is TRUE when a row passes the quality rule (NULL fails)"""
+    kind = rule['type']
+    if kind == 'range':
+        lower = '>=' if rule.get('inclusive') else '>'
+        upper = '<=' if rule.get('inclusive') else '<'
+        checks = []
+        for column in rule['columns']:
+            if 'min' in rule:
+                checks.append(f"{_quote(column)} {lower} {rule['min']}")
+            if 'max' in rule:
+                checks.append(f"{_quote(column)} {upper} {rule['max']}")
+        predicate = ' AND '.join(checks)
+    elif kind == 'compare':
+        predicate = f"{_quote(rule['column'])} {rule['op']} {_quote(rule['other'])}"
+    elif kind == 'sum_equals':
+        predicate = f"({' + '.join(_quote(c) for c in rule['columns'])}) = {_quote(rule['total'])}"
+    else:
+        raise ValueError(f"Unknown quality rule type: {kind}")
+    return f"COALESCE({predicate}, FALSE)"
+
+
+def _key_expression(column):
+    if column == 'property_key':
+        return "split_part(property_url, '?', 1)"
+    return _quote(column)
+
+
+def _zone_expression(parts):
+    starts = ' OR '.join(f"starts_with(p, {_sql_literal(i)})" for i in ZONE_IDENTIFIERS)
+    regions = ' OR '.join(f"contains({parts}[i], {_sql_literal(r)})" for r in REGION_INDICATORS)
+    # first part naming an administrative zone, else the part just before the region
+    return (f"COALESCE(list_filter({parts}, lambda p: {starts})[1], "
+            f"{parts}[list_filter(range(2, len({parts}) + 1), lambda i: {regions})[1] - 1])")
+
+
+def transform_duckdb(files, timestamp, staging_dir, dedup_key, keep_latest=False, rules=QUALITY_RULES,
+                     threads=None, layout=STAGING_LAYOUT, output_path=None, part_name="part-0"):
+    """Run the transform as SQL in an embedded DuckDB and write the staging parquet.
+
+    Mirrors the pandas path: timestamp normalisation, city override,
+    weighted_avg, quality rules (with quarantine), zone backfill, then the
+    global natural-key dedup. Returns the staging output path (parquet file
+    or partitioned dataset directory, depending on the layout).
+    """
+    import duckdb
+
+    con = duckdb.connect()
+    # normalized_timestamp is a UTC instant, naive scrape times are read as UTC
+    con.execute("SET TimeZone = 'UTC'")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+
+    try:
+        # raw files are scanned in parallel, insertion order keeps file then row order
+        # (csv files first, then the typed parquet micro-batches of the streaming mode)
+        csv_files = [os.path.abspath(f) for f in files if not f.endswith('.parquet')]
+        parquet_files = [os.path.abspath(f) for f in files if f.endswith('.parquet')]
+        sources = ([f"SELECT * FROM read_csv({csv_files}, header = true, union_by_name = true)"] if csv_files else []) + \
+            ([f"SELECT * FROM read_parquet({parquet_files}, union_by_name = true)"] if parquet_files else [])
+        with span("read_raw", "io", files=len(files), bytes=sum(os.path.getsize(f) for f in files)) as trace:
+            con.execute(f"""
+                CREATE TEMP TABLE raw AS
+                SELECT *, row_number() OVER () AS _row_id
+                FROM ({' UNION ALL BY NAME '.join(sources)})
+            """)
+            trace["rows"] = con.execute("SELECT count(*) FROM raw").fetchone()[0]
+        raw_columns = [row[0] for row in con.execute("DESCRIBE raw").fetchall() if row[0] != '_row_id']
+
+        count_sum = ' + '.join(f"avg_review_score_{t}_count" for t in TRAVELER_TYPES)
+        weighted_sum = ' + '.join(f"avg_review_score_{t} * avg_review_score_{t}_count" for t in TRAVELER_TYPES)
+        # Unix timestamps (milliseconds) become timestamps, datetime strings are parsed
+        scrape_ts = ("CASE WHEN TRY_CAST(scrape_timestamp AS DOUBLE) IS NOT NULL "
+                     "THEN to_timestamp(CAST(scrape_timestamp AS DOUBLE) / 1000)::TIMESTAMP "
+                     "ELSE CAST(scrape_timestamp AS TIMESTAMP) END")
+        # Tangier is applied last in pandas, so it wins when both names appear
+        city = ("CASE WHEN contains(address, 'Tangier') THEN 'Tangier' "
+                "WHEN contains(address, 'Marrakech') THEN 'Marrakech' ELSE city END")
+        failed_flags = ',\n'.join(
+            f"NOT {rule_predicate(rule)} AS {_quote('_failed_' + rule['name'])}" for rule in rules)
+
+        with span("apply_quality_rules", "transform"):
+            con.execute(f"""
+                CREATE TEMP TABLE checked AS
+                SELECT * REPLACE ({scrape_ts} AS scrape_timestamp, {city} AS city),
+                       ({scrape_ts})::TIMESTAMPTZ AS normalized_timestamp,
+                       ({weighted_sum}) / ({count_sum}) AS weighted_avg,
+                       {failed_flags}
+                FROM raw
+            """)
+
+        rejecting = [_quote('_failed_' + r['name']) for r in rules if r.get('action', 'reject') == 'reject']
+        rejected = ' OR '.join(rejecting) if rejecting else 'FALSE'
+        flag_columns = ', '.join(_quote('_failed_' + r['name']) for r in rules)
+
+        counts = con.execute(
+            'SELECT ' + ', '.join(f"count_if({_quote('_failed_' + r['name'])})" for r in rules) + ' FROM checked'
+        ).fetchone()
+        rule_counts = dict(zip([r['name'] for r in rules], counts))
+        print(f"🔎 Quality rule failures: {rule_counts}")
+
+        failed_rules = "concat_ws(';', " + ', '.join(
+            f"CASE WHEN {_quote('_failed_' + r['name'])} THEN {_sql_literal(r['name'])} END" for r in rules) + ")"
+        quarantined = con.execute(f"""
+            SELECT * EXCLUDE (_row_id, {flag_columns}), {failed_rules} AS failed_rules
+            FROM checked WHERE {rejected} ORDER BY _row_id
+        """).df()
+        with span("write_quarantine", "io", rows=len(quarantined)) as trace:
+            quarantine_path = write_quarantine(quarantined, timestamp)
+            trace["bytes"] = os.path.getsize(quarantine_path) if quarantine_path else 0
+        if quarantine_path:
+            print(f"🚧 Quarantined {len(quarantined)} rows into {quarantine_path}")
+
+        fingerprint = f"hash({', '.join(_key_expression(c) for c in dedup_key)})"
+        keep_order = "scrape_timestamp DESC, _row_id DESC" if keep_latest else "_row_id"
+        address_parts = "list_filter(list_transform(string_split(address, '  '), lambda p: trim(p)), lambda p: p <> '')"
+        with span("deduplicate", "transform"):
+            con.execute(f"""
+                CREATE TEMP TABLE staged AS
+                WITH valid AS (
+                    SELECT * EXCLUDE ({flag_columns}),
+                           CASE WHEN zone IS NULL THEN {address_parts} END AS _address_parts
+                    FROM checked
+                    WHERE NOT ({rejected})
+                )
+                SELECT * EXCLUDE (_address_parts) REPLACE (COALESCE(zone, {_zone_expression('_address_parts')}) AS zone)
+                FROM valid
+                QUALIFY row_number() OVER (PARTITION BY {fingerprint} ORDER BY {keep_order}) = 1
+            """)
+        rows_in = con.execute(f"SELECT count(*) FROM checked WHERE NOT ({rejected})").fetchone()[0]
+        rows_out = con.execute("SELECT count(*) FROM staged").fetchone()[0]
+        print(f"🧹 Deduplication on {list(dedup_key)}: {rows_in} -> {rows_out} rows, "
+              f"dropped {{'duplicate_key': {rows_in - rows_out}}}")
+
+        # same column order as the pandas output: normalized_timestamp right after
+        # scrape_timestamp, weighted_avg right after general_review_count
+        columns = []
+        for column in raw_columns:
+            columns.append(_quote(column))
+            if column == 'scrape_timestamp':
+                columns.append('normalized_timestamp')
+            if column == 'general_review_count':
+                columns.append('weighted_avg')
+
+        output_path = output_path or staging_path(timestamp, staging_dir, layout)
+        # surrogate keys are hashed in pandas, so both engines produce the same values
+        with span("add_surrogate_keys", "transform", rows=rows_out):
+            staged = add_surrogate_keys(
+                con.execute(f"SELECT {', '.join(columns)} FROM staged ORDER BY _row_id").fetch_arrow_table())
+        with span("update_key_maps", "transform", rows=rows_out):
+            print(f"🔑 New dimension members: {update_key_maps(staged)}")
+        with span("write_staging", "io", rows=rows_out, layout=layout) as trace:
+            if layout == "partitioned":
+                # shared writer, so both engines produce the same files and encodings
+                files_written = write_staging_dataset(staged, output_path, part_name=part_name)
+                print(f"🗂️ Wrote {len(files_written)} staging partitions into {output_path}")
+            else:
+                pq.write_table(staged, output_path)
+                files_written = [output_path]
+            trace["bytes"] = sum(os.path.getsize(path) for path in files_written)
+        print(f"✅ Transformation complete. Final row count: {rows_out}")
+        print(f"✅ Transformation complete. Final columns count: {staged.num_columns}")
+        return output_path
+    finally:
+        con.close()
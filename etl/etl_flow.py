@@ -1,47 +1,123 @@
-from prefect import flow, task
-import sys
+from prefect import flow, task, unmapped
+from prefect.task_runners import ConcurrentTaskRunner
 import os
-# Add the parent directory (project root) to Python path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import threading
+# run from the project root as a module (python -m etl.etl_flow), so etl and scraper are importable
 from scraper import scrape_single_threaded
 from etl import transform
 from etl import loading2snowflake
 from etl import olap_modeling
+from etl.caching import CACHE_EXPIRATION, FORCE_REFRESH, load_cache_key, transform_cache_key
+from etl.staging import link_staging_part, staging_path
+from etl.transform import destination_raw_files, destination_slug, other_raw_files, staging_timestamp
+from etl.tracing import trace_run, traced
+from etl.warehouse import warehouse_session
+
+# destinations scraped by the flow, comma separated
+ETL_DESTINATIONS = [d.strip() for d in os.getenv("ETL_DESTINATIONS", "Marrakech,Tangier").split(",") if d.strip()]
+# browser sessions the Selenium grid runs at once (SE_NODE_MAX_SESSIONS), a scrape holds one
+SELENIUM_SESSIONS = int(os.getenv("SELENIUM_SESSIONS", "2"))
+# the concurrent task runner runs tasks as threads of the flow process,
+# so extra scrapes wait here instead of queueing inside the grid
+selenium_sessions = threading.BoundedSemaphore(SELENIUM_SESSIONS)
+# also put every scraped batch on the streaming queue (python -m etl.streaming transform / load)
+ETL_STREAMING = os.getenv("ETL_STREAMING", "false").lower() in ("1", "true", "yes")
 
 
 @task
-def extract_data():
-    print("Starting extraction...")
-    cities = ["Marrakech", "Tangier"]
-    #scrape_single_threaded(cities, batch_size=5)
-    print("Extraction completed!")
+@traced("extract_data", "task")
+def extract_data(destination):
+    with selenium_sessions:
+        print(f"Starting extraction of {destination}...")
+        raw_file = scrape_single_threaded([destination], batch_size=5, stream=ETL_STREAMING)
+        print(f"Extraction of {destination} completed!")
+    return raw_file
 
 
-@task
-def transform_data():
-    print(f"Transforming data")
-    transformed_file = transform()
-    print("Transformation completed!")
-    return transformed_file
+# cached on the destination's raw files + the transform code: an unchanged destination
+# returns the earlier output its part was written into, staged_part links it over
+@task(cache_key_fn=transform_cache_key, cache_expiration=CACHE_EXPIRATION, persist_result=True)
+@traced("transform_destination", "task")
+def transform_destination(destination, staging_output, raw_file=None):
+    """Transform every raw file of one destination into its part of the run's staging output"""
+    files = destination_raw_files(destination)
+    if not files:
+        print(f"No raw data for {destination}")
+        return None
+    print(f"Transforming {len(files)} raw files of {destination}")
+    return transform(files=files, output_path=staging_output, part_name=f"part-{destination_slug(destination)}")
 
-@task
+
+@task(cache_key_fn=transform_cache_key, cache_expiration=CACHE_EXPIRATION, persist_result=True)
+@traced("transform_other_raw_files", "task")
+def transform_other_raw_files(destinations, staging_output):
+    files = other_raw_files(destinations)
+    if not files:
+        return None
+    print(f"Transforming {len(files)} other raw files")
+    return transform(files=files, output_path=staging_output, part_name="part-other")
+
+
+# cached on the content of the staging output + the load / modeling code
+@task(cache_key_fn=load_cache_key, cache_expiration=CACHE_EXPIRATION, persist_result=True)
+@traced("load_data", "task")
 def load_data(transformed_file):
-    print(f"Loading data into snowflake :")
-    loading2snowflake(transformed_file)
-    print("Loading completed!")
-    olap_modeling()
-    print("OLAP data model loaded the data successfully")
+    # one warehouse login shared by the load and the modeling
+    with warehouse_session():
+        print(f"Loading data into snowflake :")
+        loading2snowflake(transformed_file)
+        print("Loading completed!")
+        olap_modeling()
+        print("OLAP data model loaded the data successfully")
     return "success"
 
-@flow
-def booking_etl_flow():
-    print("Flow started!")
-    extract_data()
-    transformed_file = transform_data()
-    load_data(transformed_file)
+
+def staged_part(output, staging_output, part_name, transform_task, *args):
+    """The part of a transform task in this run's staging output, None if it had no raw files.
+
+    A cached transform returns the earlier run's output it wrote its part into:
+    those files are linked into this run's output (the loader skips them by
+    content hash), or the transform is rerun when that output is gone.
+    """
+    if output is None or os.path.basename(os.path.normpath(output)) == os.path.basename(staging_output):
+        return output
+    # the flow hands over container paths, read them relative to the working dir when needed
+    local_output = output if os.path.exists(output) else output.replace("/opt/prefect/", "./", 1)
+    if link_staging_part(local_output, staging_output, part_name):
+        print(f"♻️ Reused the cached {part_name} of {output}")
+        return output
+    print(f"♻️ The cached {part_name} of {output} is gone, transforming it again")
+    return transform_task.with_options(refresh_cache=True)(*args)
+
+
+@flow(task_runner=ConcurrentTaskRunner())
+def booking_etl_flow(force_refresh: bool = FORCE_REFRESH, destinations: list = None):
+    destinations = destinations or ETL_DESTINATIONS
+    print(f"Flow started for {destinations}!")
+    # every task of the run appends its spans to one trace file (python -m etl.tracing export)
+    with trace_run("booking_etl_flow"):
+        # every transform of the run writes its own files into this one partitioned output
+        staging_output = staging_path(staging_timestamp())
+
+        transform_others = transform_other_raw_files.with_options(refresh_cache=force_refresh)
+        others = transform_others.submit(destinations, staging_output)
+        raw_files = extract_data.map(destinations)
+        # each destination is transformed as soon as its own scrape returns
+        transform_destinations = transform_destination.with_options(refresh_cache=force_refresh)
+        transformed = transform_destinations.map(destinations, unmapped(staging_output), raw_files)
+
+        parts = [staged_part(others.result(), staging_output, "part-other", transform_other_raw_files,
+                             destinations, staging_output)]
+        for destination, future in zip(destinations, transformed):
+            parts.append(staged_part(future.result(), staging_output, f"part-{destination_slug(destination)}",
+                                     transform_destination, destination, staging_output))
+        if not any(parts):
+            print("No raw data to load")
+            return
+        load_data.with_options(refresh_cache=force_refresh)(staging_output)
 
 
 if __name__ == "__main__":
     print("Running booking ETL flow...")
     booking_etl_flow()
-    print("Done!")
\ No newline at end of file
+    print("Done!")
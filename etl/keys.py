@@ -0,0 +1,139 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Natural key used to identify a single scrape of a single property.
+# "property_key" is the canonical property url (query string stripped), the
+# same canonical form the scraper uses to avoid visiting a property twice.
+DEDUP_KEY = ["property_key", "scrape_timestamp"]
+
+# surrogate key -> the natural key columns it is hashed from
+DIMENSION_KEYS = {
+    "property_sk": ["property_key"],
+    "category_sk": ["category"],
+    "location_sk": ["city", "zone"],
+    "date_sk": ["scrape_ms"],
+}
+# attributes of a property whose changes open a new version of it in DIM_PROPERTY
+PROPERTY_ATTRIBUTES = ["address", "wifi_speed", "latitude", "longitude"]
+# staging columns the natural keys (and the attribute hash) are derived from
+KEY_SOURCE_COLUMNS = ["property_url", "category", "city", "zone", "normalized_timestamp"] + PROPERTY_ATTRIBUTES
+# natural key <-> surrogate key of every dimension member seen so far, one parquet file per key
+KEY_MAP_DIR = os.getenv("KEY_MAP_DIR", "./data/keys")
+# transforms running concurrently in one process (one per destination) share the key map files
+_key_map_lock = threading.Lock()
+
+
+def canonical_property_key(property_url):
+    # Booking urls carry per-session query params (aid, label, checkin, ...),
+    # only the path identifies the property
+    return property_url.str.split('?', n=1).str[0]
+
+
+def _key_frame(df, key_columns):
+    keys = {}
+    for column in key_columns:
+        if column == "property_key" and column not in df.columns:
+            keys[column] = canonical_property_key(df["property_url"])
+        else:
+            keys[column] = df[column]
+    return pd.DataFrame(keys, index=df.index)
+
+
+def row_fingerprint(df, key_columns=DEDUP_KEY):
+    """Vectorized 64-bit hash of the natural key of every row"""
+    return pd.util.hash_pandas_object(_key_frame(df, key_columns), index=False).to_numpy()
+
+
+def hash64(frame):
+    """Deterministic 64-bit hash of every row, signed so it fits a BIGINT column"""
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+
+
+def epoch_ms(timestamps):
+    # same value whatever the datetime unit / timezone the engine produced
+    return pd.to_datetime(timestamps, utc=True).astype('datetime64[ms, UTC]').astype('int64')
+
+
+def natural_keys(df):
+    """Natural key columns of the dimensions, nulls as None so every engine hashes them alike"""
+    natural = pd.DataFrame({
+        "property_key": canonical_property_key(df["property_url"]),
+        "category": df["category"],
+        "city": df["city"],
+        "zone": df["zone"],
+    }).reset_index(drop=True)
+    natural = natural.astype(object).where(natural.notna(), None)
+    natural["scrape_ms"] = np.asarray(epoch_ms(df["normalized_timestamp"]))
+    return natural
+
+
+def surrogate_keys(df):
+    """Warehouse keys of the staging rows, hashed from their natural keys.
+
+    Every dimension key is known before the load, so the fact rows carry
+    them directly; review_sk identifies one scrape of one property (the
+    fact grain).
+    """
+    natural = natural_keys(df)
+    keys = {sk: hash64(natural[columns]) for sk, columns in DIMENSION_KEYS.items()}
+    keys["review_sk"] = hash64(natural[["property_key", "scrape_ms"]])
+    return keys
+
+
+def attribute_hash(df, columns=PROPERTY_ATTRIBUTES):
+    """64-bit hash of the tracked attributes of every row, so a change is one integer comparison"""
+    attributes = df[columns].reset_index(drop=True)
+    for column in columns:
+        values = attributes[column]
+        # coordinates rounded to ~0.1 m: the engines parse the last float digit differently
+        attributes[column] = values.astype("float64").round(6) if values.dtype.kind == "f" else \
+            values.astype(object).where(values.notna(), None)
+    return hash64(attributes)
+
+
+def update_key_maps(data, key_map_dir=KEY_MAP_DIR):
+    """Record the natural key behind every dimension key in the local key maps.
+
+    A surrogate key hashed from two different natural keys (a 64-bit
+    collision) raises instead of silently merging two dimension members.
+    Returns the number of members seen for the first time, per key.
+    """
+    if isinstance(data, pa.Table):
+        data = data.select(KEY_SOURCE_COLUMNS).to_pandas()
+    natural = natural_keys(data)
+    os.makedirs(key_map_dir, exist_ok=True)
+    with _key_map_lock:
+        new_members = {}
+        for sk, columns in DIMENSION_KEYS.items():
+            members = natural[columns].drop_duplicates()
+            members.insert(0, sk, hash64(members))
+            path = os.path.join(key_map_dir, f"{sk}.parquet")
+            known = pd.read_parquet(path) if os.path.exists(path) else members.iloc[:0]
+            key_map = pd.concat([known, members], ignore_index=True).drop_duplicates()
+            collisions = key_map[key_map.duplicated(sk, keep=False)]
+            if len(collisions):
+                raise ValueError(f"{sk} collision between {collisions[columns].to_dict('records')}")
+            new_members[sk] = len(key_map) - len(known)
+            if new_members[sk]:
+                key_map.to_parquet(path + ".tmp", index=False)
+                os.replace(path + ".tmp", path)
+        return new_members
+
+
+def _key_columns(df):
+    keys = surrogate_keys(df)
+    keys["property_attr_hash"] = attribute_hash(df)
+    return keys
+
+
+def add_surrogate_keys(data):
+    """Append the surrogate key and attribute hash columns to a pandas frame or an arrow table"""
+    if isinstance(data, pa.Table):
+        keys = _key_columns(data.select(KEY_SOURCE_COLUMNS).to_pandas())
+        for name, values in keys.items():
+            data = data.append_column(name, pa.array(values, pa.int64()))
+        return data
+    return data.assign(**_key_columns(data))
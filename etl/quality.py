@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+REVIEW_SCORE_COLUMNS = [
+    'avg_review_score_all',
+    'avg_review_score_families',
+    'avg_review_score_couples',
+    'avg_review_score_solo_travelers',
+    'avg_review_score_groups_friends',
+    'avg_review_score_business_travellers',
+]
+
+TRAVELER_COUNT_COLUMNS = [
+    'avg_review_score_families_count',
+    'avg_review_score_couples_count',
+    'avg_review_score_solo_travelers_count',
+    'avg_review_score_business_travellers_count',
+    'avg_review_score_groups_friends_count',
+]
+
+# Data Quality Rules
+# Every rule is plain data: "range" bounds are exclusive unless inclusive=True,
+# a missing value always fails. Rows failing a "reject" rule go to quarantine,
+# "warn" rules are only counted.
+QUALITY_RULES = [
+    # Review Score Range Check
+    {'name': 'review_score_range', 'type': 'range', 'columns': REVIEW_SCORE_COLUMNS, 'min': 0, 'max': 10},
+    # Review Count Check
+    {'name': 'review_count_positive', 'type': 'range',
+     'columns': ['avg_review_score_all_count'] + TRAVELER_COUNT_COLUMNS, 'min': 0},
+    # Latitude & Longitude Validity
+    {'name': 'latitude_range', 'type': 'range', 'columns': ['latitude'], 'min': -90, 'max': 90},
+    {'name': 'longitude_range', 'type': 'range', 'columns': ['longitude'], 'min': -180, 'max': 180},
+    # Price Validity
+    {'name': 'min_price_non_negative', 'type': 'range', 'columns': ['min_price'], 'min': 0, 'inclusive': True},
+    {'name': 'price_order', 'type': 'compare', 'column': 'max_price', 'op': '>=', 'other': 'min_price'},
+    # Consistency between review counts and totals
+    {'name': 'review_count_consistency', 'type': 'sum_equals', 'columns': TRAVELER_COUNT_COLUMNS,
+     'total': 'avg_review_score_all_count', 'action': 'warn'},
+]
+
+QUARANTINE_DIR = "./data/quarantine"
+
+_COMPARE_OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+}
+
+
+def _values(df, columns):
+    return df[columns].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _compile_rule(rule):
+    """Turn a rule dict into a function returning the per-row pass mask"""
+    kind = rule['type']
+
+    if kind == 'range':
+        lower = np.greater_equal if rule.get('inclusive') else np.greater
+        upper = np.less_equal if rule.get('inclusive') else np.less
+
+        def check(df):
+            values = _values(df, rule['columns'])
+            passed = np.ones(values.shape, dtype=bool)
+            if 'min' in rule:
+                passed &= lower(values, rule['min'])
+            if 'max' in rule:
+                passed &= upper(values, rule['max'])
+            return passed.all(axis=1)
+
+    elif kind == 'compare':
+        op = _COMPARE_OPS[rule['op']]
+
+        def check(df):
+            return op(_values(df, [rule['column']])[:, 0], _values(df, [rule['other']])[:, 0])
+
+    elif kind == 'sum_equals':
+        def check(df):
+            return _values(df, rule['columns']).sum(axis=1) == _values(df, [rule['total']])[:, 0]
+
+    else:
+        raise ValueError(f"Unknown quality rule type: {kind}")
+
+    return check
+
+
+def compile_rules(rules=QUALITY_RULES):
+    checks = [_compile_rule(rule) for rule in rules]
+    names = [rule['name'] for rule in rules]
+    rejecting = np.array([rule.get('action', 'reject') == 'reject' for rule in rules], dtype=bool)
+
+    def evaluate(df):
+        # one column per rule, True where the row fails it
+        failed = np.empty((len(df), len(checks)), dtype=bool)
+        for i, check in enumerate(checks):
+            failed[:, i] = ~check(df)
+        return failed
+
+    return names, rejecting, evaluate
+
+
+_DEFAULT_RULES = compile_rules(QUALITY_RULES)
+
+
+def apply_quality_rules(df, rules=None):
+    """Evaluate every rule in one pass and split the frame into valid and quarantined rows.
+
+    Returns (valid_df, quarantined_df, rule_counts); quarantined rows carry a
+    'failed_rules' column listing every rule they failed.
+    """
+    names, rejecting, evaluate = _DEFAULT_RULES if rules is None else compile_rules(rules)
+    failed = evaluate(df)
+    rejected = failed[:, rejecting].any(axis=1)
+    rule_counts = dict(zip(names, failed.sum(axis=0).tolist()))
+
+    quarantined = df[rejected].copy()
+    quarantined['failed_rules'] = [
+        ';'.join(name for name, hit in zip(names, row) if hit) for row in failed[rejected]
+    ]
+    return df[~rejected], quarantined, rule_counts
+
+
+def write_quarantine(quarantined, timestamp, quarantine_dir=QUARANTINE_DIR):
+    if quarantined.empty:
+        return None
+    os.makedirs(quarantine_dir, exist_ok=True)
+    path = f"{quarantine_dir}/quarantined_booking{timestamp}.parquet"
+    quarantined.to_parquet(path, index=False)
+    return path
@@ -0,0 +1,139 @@
+import argparse
+import os
+import time
+from collections import OrderedDict
+from .duckdb_engine import TRAVELER_TYPES
+from .staging import STAGING_DIR, latest_staging_output, list_staging_files
+from .warehouse import sql_list
+
+# number of query results kept in memory by the serving layer
+SERVING_CACHE_SIZE = int(os.getenv("SERVING_CACHE_SIZE", "128"))
+
+# latest scrape of every property of the staging output, optionally for one city
+LATEST_PROPERTIES = """
+    WITH latest AS (
+        SELECT *, split_part(property_url, '?', 1) AS property_key
+        FROM staging
+        WHERE $city IS NULL OR city = $city
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY split_part(property_url, '?', 1) ORDER BY scrape_timestamp DESC) = 1
+    )
+"""
+
+_traveler_breakdown = "\n        UNION ALL\n".join(f"""
+        SELECT
+            city,
+            '{traveler}' AS traveler_type,
+            SUM(avg_review_score_{traveler}_count) AS reviews,
+            SUM(avg_review_score_{traveler} * avg_review_score_{traveler}_count)
+                / NULLIF(SUM(avg_review_score_{traveler}_count), 0) AS avg_score
+        FROM latest
+        GROUP BY city""" for traveler in TRAVELER_TYPES)
+
+# canned queries: name -> (sql, default parameters)
+QUERIES = {
+    "top_properties": (LATEST_PROPERTIES + """
+        SELECT city, zone, property_key, category, weighted_avg, general_review_count, min_price, max_price
+        FROM latest
+        WHERE weighted_avg IS NOT NULL
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY city, zone ORDER BY weighted_avg DESC, general_review_count DESC) <= $limit
+        ORDER BY city, zone, weighted_avg DESC
+    """, {"city": None, "limit": 5}),
+    "price_spread": (LATEST_PROPERTIES + """
+        SELECT
+            category,
+            COUNT(*) AS properties,
+            MIN(min_price) AS lowest_price,
+            QUANTILE_CONT(min_price, 0.5) AS median_min_price,
+            QUANTILE_CONT(max_price, 0.5) AS median_max_price,
+            MAX(max_price) AS highest_price,
+            AVG(max_price - min_price) AS avg_spread,
+            QUANTILE_CONT(max_price - min_price, 0.9) AS p90_spread
+        FROM latest
+        GROUP BY category
+        ORDER BY avg_spread DESC
+    """, {"city": None}),
+    "traveler_types": (LATEST_PROPERTIES + _traveler_breakdown + """
+        ORDER BY city, avg_score DESC
+    """, {"city": None}),
+}
+
+
+class StagingQueryService:
+    """Canned analytical queries over the latest staging output, in an embedded DuckDB.
+
+    Results are kept in an LRU cache keyed by query name and parameters. The
+    staging files are listed (names, sizes, mtimes) before every query and the
+    whole cache is dropped as soon as they differ, so a new transform run is
+    picked up without serving stale results.
+    """
+
+    def __init__(self, staging_dir=STAGING_DIR, cache_size=SERVING_CACHE_SIZE):
+        import duckdb
+
+        self.staging_dir = staging_dir
+        self.cache_size = cache_size
+        self.con = duckdb.connect()
+        self.cache = OrderedDict()
+        self.snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def _refresh(self):
+        path = latest_staging_output(self.staging_dir)
+        if path is None:
+            raise FileNotFoundError(f"No staging output in {self.staging_dir}")
+        files = list_staging_files(path)
+        snapshot = tuple((file, os.stat(file).st_mtime_ns, os.stat(file).st_size) for file in files)
+        if snapshot != self.snapshot:
+            self.cache.clear()
+            # the files carry every column (city included), the partition directories are not needed
+            self.con.execute(f"""
+                    CREATE OR REPLACE VIEW staging AS
+                    SELECT * FROM read_parquet([{sql_list(files)}], hive_partitioning = false, union_by_name = true)
+                    """)
+            self.snapshot = snapshot
+            print(f"📂 Serving {len(files)} staging files from {path}")
+
+    def query(self, name, **params):
+        """Result of a canned query as a pandas DataFrame"""
+        if name not in QUERIES:
+            raise ValueError(f"Unknown query: {name}, expected one of {list(QUERIES)}")
+        sql, defaults = QUERIES[name]
+        params = {**defaults, **{k: v for k, v in params.items() if k in defaults}}
+
+        self._refresh()
+        key = (name, tuple(sorted(params.items())))
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        self.misses += 1
+        result = self.con.execute(sql, params).df()
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def close(self):
+        self.con.close()
+
+
+if __name__ == "__main__":
+    #   python -m etl.serving top_properties --city Marrakech --limit 3
+    parser = argparse.ArgumentParser(description="Canned queries over the latest staging output")
+    parser.add_argument("query", choices=list(QUERIES))
+    parser.add_argument("--city")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--staging-dir", default=STAGING_DIR)
+    parser.add_argument("--repeat", type=int, default=1, help="run the query again to time the cached result")
+    args = parser.parse_args()
+
+    service = StagingQueryService(args.staging_dir)
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = service.query(args.query, city=args.city, limit=args.limit)
+        print(f"⚡ {args.query}: {len(result)} rows in {time.perf_counter() - start:.4f}s "
+              f"(cache hits {service.hits}, misses {service.misses})")
+    print(result.to_string(index=False))
+    service.close()
@@ -0,0 +1,156 @@
+import os
+import shutil
+from urllib.parse import quote
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+STAGING_DIR = "./data/staging"
+
+# "partitioned": Hive-style dataset staged_booking{timestamp}/city=.../scrape_date=.../part-0.parquet
+# "flat": the single staged_booking{timestamp}.parquet (+ csv) of the first versions
+# The partitioned files also keep city as a column (each file loads on its own), so a
+# plain pd.read_parquet / pq.read_table of the dataset directory fails on the city key:
+# open it with staging_dataset(), the warehouse loaders read the files one by one.
+STAGING_LAYOUT = os.getenv("STAGING_LAYOUT", "partitioned")
+STAGING_ROW_GROUP_SIZE = int(os.getenv("STAGING_ROW_GROUP_SIZE", "131072"))
+
+# low-cardinality text columns, dictionary encoded (everything else is plain + zstd)
+DICTIONARY_COLUMNS = ['category', 'city', 'zone', 'wifi_speed']
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+PARQUET_WRITE_OPTIONS = {
+    'compression': 'zstd',
+    'write_statistics': True,
+    # the warehouse load expects millisecond timestamps, as written by the csv -> arrow path
+    'coerce_timestamps': 'ms',
+    'allow_truncated_timestamps': True,
+}
+
+
+def staging_path(timestamp, staging_dir=STAGING_DIR, layout=STAGING_LAYOUT):
+    if layout == "partitioned":
+        return f"{staging_dir}/staged_booking{timestamp}"
+    return f"{staging_dir}/staged_booking{timestamp}.parquet"
+
+
+def write_staging(combined_df, timestamp, staging_dir=STAGING_DIR):
+    """Flat layout: csv, re-read by arrow for type inference, then one parquet file"""
+    combined_df.to_csv(f'{staging_dir}/staged_booking{timestamp}.csv', index=False)
+    # Read CSV into Arrow Table
+    table = pv.read_csv(f'{staging_dir}/staged_booking{timestamp}.csv')
+    # Write to Parquet
+    pq.write_table(table, f'{staging_dir}/staged_booking{timestamp}.parquet')
+    return staging_path(timestamp, staging_dir, "flat")
+
+
+def _partition_value(value):
+    if value is None or value == '':
+        return HIVE_DEFAULT_PARTITION
+    # same uri segment encoding pyarrow and duckdb decode when reading hive partitions
+    return quote(str(value), safe='')
+
+
+def write_staging_dataset(table, dataset_dir, row_group_size=STAGING_ROW_GROUP_SIZE, part_name="part-0"):
+    """Write an arrow table as a city / scrape_date Hive-partitioned parquet dataset.
+
+    Files keep every staging column (city included) so each one can be loaded
+    on its own; scrape_date only lives in the directory name. Rows are sorted
+    by scrape_timestamp inside a partition so row-group statistics stay tight.
+    Several writers can share a dataset with distinct part names (one file
+    each per partition). Returns the written file paths.
+    """
+    # plain string columns whatever pandas / duckdb produced, so every file
+    # (and the city partition key) shares one schema
+    table = table.cast(pa.schema([
+        field.with_type(pa.string()) if pa.types.is_large_string(field.type) else field for field in table.schema
+    ]))
+    scrape_date = pc.strftime(table['scrape_timestamp'], format='%Y-%m-%d')
+    city = table['city'].cast(pa.string())
+    city_key = pc.fill_null(pc.if_else(pc.equal(city, ''), pa.scalar(None, pa.string()), city), HIVE_DEFAULT_PARTITION)
+    partition_key = pc.binary_join_element_wise(city_key, scrape_date, '/')
+
+    order = pc.sort_indices(
+        pa.table({'key': partition_key, 'ts': table['scrape_timestamp']}),
+        sort_keys=[('key', 'ascending'), ('ts', 'ascending')],
+    )
+    table = table.take(order)
+    scrape_date = scrape_date.take(order)
+    codes = pc.dictionary_encode(partition_key.take(order).combine_chunks()).indices.to_numpy()
+    # row offsets where the (city, scrape_date) partition changes
+    starts = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1]) if len(codes) else []
+
+    dictionary_columns = [c for c in DICTIONARY_COLUMNS if c in table.column_names]
+    paths = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else table.num_rows
+        part = table.slice(start, end - start)
+        city = part['city'][0].as_py()
+        directory = os.path.join(
+            dataset_dir, f"city={_partition_value(city)}", f"scrape_date={scrape_date[int(start)].as_py()}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{part_name}.parquet")
+        pq.write_table(part, path, row_group_size=row_group_size, use_dictionary=dictionary_columns,
+                       **PARQUET_WRITE_OPTIONS)
+        paths.append(path)
+    return paths
+
+
+def list_staging_files(path):
+    """Parquet files of a staging output, whichever layout it was written with"""
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(root, file)
+            for root, _, files in os.walk(path)
+            for file in files if file.endswith('.parquet')
+        )
+    return [path]
+
+
+def link_staging_part(source_output, output_path, part_name):
+    """Hard-link (or copy) the {part_name}.parquet files of a partitioned output into the
+    same partitions of another output, returns the linked paths"""
+    paths = []
+    for path in list_staging_files(source_output) if os.path.isdir(source_output) else []:
+        if os.path.basename(path) != f"{part_name}.parquet":
+            continue
+        target = os.path.join(output_path, os.path.relpath(path, source_output))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+        paths.append(target)
+    return paths
+
+
+def latest_staging_output(staging_dir=STAGING_DIR):
+    """Most recent staged_booking{timestamp} output (directory or flat parquet), None if there is none"""
+    if not os.path.isdir(staging_dir):
+        return None
+    outputs = sorted(
+        entry.path for entry in os.scandir(staging_dir)
+        if entry.name.startswith("staged_booking") and (entry.is_dir() or entry.name.endswith(".parquet"))
+    )
+    return outputs[-1] if outputs else None
+
+
+def staging_dataset(path):
+    """pyarrow dataset over a staging output, with city / scrape_date partition pruning.
+
+    The supported way to read a partitioned output as a whole (.to_table().to_pandas()
+    for a DataFrame). The partition types are declared: inferring them would make
+    city a dictionary column that clashes with the city stored in the files.
+    """
+    # pyarrow.dataset brings pandas along, the loader only lists the staging files
+    import pyarrow.dataset as ds
+
+    if os.path.isdir(path):
+        partitioning = ds.partitioning(
+            pa.schema([('city', pa.string()), ('scrape_date', pa.date32())]), flavor='hive')
+        return ds.dataset(path, format='parquet', partitioning=partitioning)
+    return ds.dataset(path, format='parquet')
@@ -0,0 +1,140 @@
+import argparse
+import os
+import shutil
+import time
+import uuid
+from .OLAP_modeling import loading2snowflake, olap_modeling
+from .tracing import span, trace_run
+from .transform import transform
+from .warehouse import WAREHOUSE_BACKEND, warehouse_session
+
+# Streaming mode: scraper batches -> raw queue -> transform consumer -> staged queue -> loader.
+# Every queue is a directory of the spool, so a crash loses nothing that was put on it.
+STREAM_SPOOL_DIR = os.getenv("STREAM_SPOOL_DIR", "./data/spool")
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "5"))
+RAW_QUEUE = "raw"
+STAGED_QUEUE = "staged"
+
+
+class SpoolQueue:
+    """Durable FIFO of files (or directories) on the local disk.
+
+    Items are written under incoming/ and renamed into ready/ once complete, so
+    a consumer never sees a partial item. claim() renames the oldest ready item
+    into claimed/ and ack() deletes it after processing; items left in claimed/
+    by a crashed consumer go back to ready/ on recover() (at-least-once).
+    Names start with the creation time in ns, which orders them and dates them.
+    """
+
+    def __init__(self, name, spool_dir=STREAM_SPOOL_DIR):
+        self.root = os.path.join(spool_dir, name)
+        self.incoming = os.path.join(self.root, "incoming")
+        self.ready = os.path.join(self.root, "ready")
+        self.claimed = os.path.join(self.root, "claimed")
+        for directory in (self.incoming, self.ready, self.claimed):
+            os.makedirs(directory, exist_ok=True)
+
+    def new_item(self, suffix=""):
+        """Path under incoming/ to write the next item to"""
+        return os.path.join(self.incoming, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}{suffix}")
+
+    def put(self, path):
+        # a rename within the spool is atomic, the item appears complete or not at all
+        os.replace(path, os.path.join(self.ready, os.path.basename(path)))
+
+    def claim(self):
+        for name in sorted(os.listdir(self.ready)):
+            claimed = os.path.join(self.claimed, name)
+            try:
+                os.replace(os.path.join(self.ready, name), claimed)
+            except FileNotFoundError:
+                # claimed by another consumer in the meantime
+                continue
+            return claimed
+        return None
+
+    def ack(self, item):
+        if os.path.isdir(item):
+            shutil.rmtree(item)
+        elif os.path.exists(item):
+            os.remove(item)
+
+    def __contains__(self, name):
+        return any(os.path.exists(os.path.join(d, name)) for d in (self.ready, self.claimed))
+
+    def recover(self):
+        for name in os.listdir(self.claimed):
+            os.replace(os.path.join(self.claimed, name), os.path.join(self.ready, name))
+
+    def __len__(self):
+        return len(os.listdir(self.ready))
+
+
+def item_age(item):
+    """Seconds since the item (or the item it was derived from) was created"""
+    return (time.time_ns() - int(os.path.basename(item).split("-", 1)[0])) / 1e9
+
+
+def _consume(queue, process, poll_seconds, once):
+    queue.recover()
+    while True:
+        item = queue.claim()
+        if item is None:
+            if once:
+                return
+            time.sleep(poll_seconds)
+            continue
+        with span("micro_batch", "stream", queue=os.path.basename(queue.root), item=os.path.basename(item)):
+            process(item)
+        queue.ack(item)
+
+
+def transform_consumer(spool_dir=STREAM_SPOOL_DIR, poll_seconds=STREAM_POLL_SECONDS, once=False):
+    """Transform every scraper micro-batch into its own small staging dataset on the staged queue"""
+    staged = SpoolQueue(STAGED_QUEUE, spool_dir)
+
+    def process(item):
+        batch_id = os.path.splitext(os.path.basename(item))[0]
+        if batch_id in staged:
+            # transformed before a crash, only the ack of the raw batch was lost
+            return
+        # same name as the raw item, so the latency is still measured from the scrape
+        output_path = os.path.join(staged.incoming, batch_id)
+        shutil.rmtree(output_path, ignore_errors=True)
+        transform(files=[item], layout="partitioned", output_path=output_path, part_name=f"part-{batch_id}")
+        if os.path.isdir(output_path):
+            staged.put(output_path)
+        else:
+            print(f"🚧 Micro-batch {batch_id} had no valid rows")
+
+    _consume(SpoolQueue(RAW_QUEUE, spool_dir), process, poll_seconds, once)
+
+
+def load_consumer(spool_dir=STREAM_SPOOL_DIR, poll_seconds=STREAM_POLL_SECONDS, once=False,
+                  backend=WAREHOUSE_BACKEND):
+    """Append every staged micro-batch to the warehouse and model it, on one warehouse session"""
+
+    def process(item):
+        loading2snowflake(item, mode="append", backend=backend)
+        olap_modeling(backend)
+        print(f"⏱️ Micro-batch {os.path.basename(item)} loaded {item_age(item):.1f}s after it was scraped")
+
+    with warehouse_session(backend):
+        _consume(SpoolQueue(STAGED_QUEUE, spool_dir), process, poll_seconds, once)
+
+
+if __name__ == "__main__":
+    #   python -m etl.streaming transform   (consumes the scraper batches)
+    #   python -m etl.streaming load        (appends the transformed batches)
+    parser = argparse.ArgumentParser(description="Micro-batch consumers of the streaming mode")
+    parser.add_argument("consumer", choices=["transform", "load"])
+    parser.add_argument("--once", action="store_true", help="stop when the queue is empty")
+    parser.add_argument("--spool-dir", default=STREAM_SPOOL_DIR)
+    parser.add_argument("--poll-seconds", type=float, default=STREAM_POLL_SECONDS)
+    args = parser.parse_args()
+
+    with trace_run(f"stream_{args.consumer}"):
+        if args.consumer == "transform":
+            transform_consumer(args.spool_dir, args.poll_seconds, args.once)
+        else:
+            load_consumer(args.spool_dir, args.poll_seconds, args.once)
@@ -0,0 +1,188 @@
+import argparse
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# one trace file per traced run is written here, empty disables the tracing
+ETL_TRACE_DIR = os.getenv("ETL_TRACE_DIR", "./data/traces")
+# trace file of the current run, inherited by the worker processes of the run
+TRACE_FILE_ENV = "ETL_TRACE_FILE"
+
+_current_span = contextvars.ContextVar("etl_current_span", default=None)
+
+
+def trace_file():
+    return os.environ.get(TRACE_FILE_ENV)
+
+
+@contextmanager
+def span(name, category="etl", **attrs):
+    """Time the block as a span nested under the current span of the thread.
+
+    The block can add to the yielded attrs (rows, bytes, ...), they are written
+    with the span. Outside of a traced run this only yields the attrs.
+    """
+    path = trace_file()
+    if not path:
+        yield attrs
+        return
+    parent = _current_span.get()
+    span_id = uuid.uuid4().hex[:16]
+    token = _current_span.set(span_id)
+    started_at = time.time_ns()
+    start = time.perf_counter_ns()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter_ns() - start
+        _current_span.reset(token)
+        _write(path, {
+            "id": span_id, "parent": parent, "name": name, "cat": category,
+            "start_us": started_at // 1000, "dur_us": duration // 1000,
+            "pid": os.getpid(), "tid": threading.get_native_id(), "thread": threading.current_thread().name,
+            "attrs": attrs,
+        })
+
+
+def traced(name=None, category="etl"):
+    """Decorator form of span, named after the function by default"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _write(path, record):
+    # one write per line on an O_APPEND file, the lines of concurrent processes do not interleave
+    line = (json.dumps(record, default=str) + "\n").encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def trace_run(name, trace_dir=ETL_TRACE_DIR):
+    """Trace everything run inside the block into a new trace file, yields its path.
+
+    Nested in another traced run (a flow calling the loader), the block is only
+    a span of the outer run's trace.
+    """
+    if trace_file() or not trace_dir:
+        with span(name):
+            yield trace_file()
+        return
+    os.makedirs(trace_dir, exist_ok=True)
+    path = os.path.join(trace_dir, f"trace_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    os.environ[TRACE_FILE_ENV] = path
+    try:
+        with span(name):
+            yield path
+    finally:
+        del os.environ[TRACE_FILE_ENV]
+        print(f"🧭 Trace written to {path} (python -m etl.tracing export {path})")
+
+
+def read_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def to_chrome_trace(spans):
+    """Chrome trace event format (chrome://tracing, Perfetto), one complete event per span"""
+    events = [
+        {"name": s["name"], "cat": s["cat"], "ph": "X", "ts": s["start_us"], "dur": s["dur_us"],
+         "pid": s["pid"], "tid": s["tid"], "args": s["attrs"]}
+        for s in spans
+    ]
+    for pid, tid, thread in sorted({(s["pid"], s["tid"], s["thread"]) for s in spans}):
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def to_speedscope(spans, name="etl trace"):
+    """speedscope file format, one evented profile per thread"""
+    frames = {}
+    threads = {}
+    for s in spans:
+        frames.setdefault(s["name"], len(frames))
+        threads.setdefault((s["pid"], s["tid"], s["thread"]), []).append(s)
+
+    profiles = []
+    for (pid, tid, thread), thread_spans in sorted(threads.items()):
+        events = []
+        stack = []
+        # parents first: earliest start, then longest duration
+        for s in sorted(thread_spans, key=lambda s: (s["start_us"], -s["dur_us"])):
+            start = s["start_us"]
+            while stack and stack[-1][1] <= start:
+                frame, end = stack.pop()
+                events.append({"type": "C", "frame": frame, "at": end})
+            # clock rounding can push a child past its parent, it is cut at the parent's end
+            end = min(start + s["dur_us"], stack[-1][1]) if stack else start + s["dur_us"]
+            events.append({"type": "O", "frame": frames[s["name"]], "at": start})
+            stack.append((frames[s["name"]], end))
+        while stack:
+            frame, end = stack.pop()
+            events.append({"type": "C", "frame": frame, "at": end})
+        profiles.append({
+            "type": "evented", "name": f"{thread} (pid {pid}, tid {tid})", "unit": "microseconds",
+            "startValue": events[0]["at"], "endValue": events[-1]["at"], "events": events,
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "shared": {"frames": [{"name": frame} for frame in frames]},
+        "profiles": profiles,
+    }
+
+
+def summarize(spans, top=15):
+    """Total and self time per span name, slowest first"""
+    children = {}
+    for s in spans:
+        children[s["parent"]] = children.get(s["parent"], 0) + s["dur_us"]
+    totals = {}
+    for s in spans:
+        total = totals.setdefault(s["name"], {"count": 0, "total_us": 0, "self_us": 0})
+        total["count"] += 1
+        total["total_us"] += s["dur_us"]
+        total["self_us"] += max(s["dur_us"] - children.get(s["id"], 0), 0)
+    return sorted(totals.items(), key=lambda item: item[1]["self_us"], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    #   python -m etl.tracing export data/traces/trace_booking_etl_flow_20250920_151810.jsonl
+    parser = argparse.ArgumentParser(description="Export or summarize an ETL trace file")
+    parser.add_argument("command", choices=["export", "summary"])
+    parser.add_argument("trace")
+    parser.add_argument("--format", choices=["chrome", "speedscope", "both"], default="both")
+    args = parser.parse_args()
+
+    spans = read_trace(args.trace)
+    if args.command == "summary":
+        print(f"{len(spans)} spans, by self time:")
+        for name, total in summarize(spans):
+            print(f"    {total['self_us'] / 1e6:8.3f}s self {total['total_us'] / 1e6:8.3f}s total "
+                  f"{total['count']:>5}x  {name}")
+    else:
+        base = os.path.splitext(args.trace)[0]
+        exports = {"chrome": (to_chrome_trace, ".chrome.json"), "speedscope": (to_speedscope, ".speedscope.json")}
+        for fmt, (convert, suffix) in exports.items():
+            if args.format in (fmt, "both"):
+                with open(base + suffix, "w") as f:
+                    json.dump(convert(spans), f, default=str)
+                print(f"🧭 {fmt} trace written to {base + suffix}")
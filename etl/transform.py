@@ -1,33 +1,116 @@
 import os
+import re
+import shutil
+import numpy as np
 import pandas as pd
 from datetime import datetime, UTC, timedelta
-import pyarrow.csv as pv
+import pyarrow as pa
 import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from .keys import DEDUP_KEY, add_surrogate_keys, row_fingerprint, update_key_maps
+from .quality import apply_quality_rules, write_quarantine
+from .tracing import span, traced
+from .staging import (STAGING_DIR, STAGING_LAYOUT, staging_path, write_staging, write_staging_dataset,
+                      list_staging_files)
 
+RAW_DATA_DIR = "./data/raw"
+# union of every raw file, rewritten on each run (and read back on the next one)
+RAW_SNAPSHOT_FILE = "raw_booking.csv"
+# scraper output names: booking_properties[_single]_{destinations joined by "-"}_{YYYYmmdd_HHMMSS}.csv
+RAW_FILE_PATTERN = re.compile(r"^booking_properties_(?:single_)?(?P<destinations>.+)_(?P<date>\d{8})_\d{6}\.csv$")
 
+# TRANSFORM_WORKERS=1 keeps the serial path, 0 uses every core
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", "1"))
+# number of raw files handed to a worker process at once
+TRANSFORM_CHUNK_SIZE = int(os.getenv("TRANSFORM_CHUNK_SIZE", "1"))
+# "pandas" or "duckdb" (SQL in an embedded DuckDB, see duckdb_engine.py)
+TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE", "pandas")
 
-def transform():
-    data_src_dir = "./data/raw"
-    dfs = []
+def deduplicate(df, key_columns=DEDUP_KEY, keep_latest=False):
+    """Drop rows sharing the same natural key, comparing one uint64 per row.
 
-    for file in os.listdir(data_src_dir):
-        if file.endswith('.csv'):
-            file_path = os.path.join(data_src_dir, file)
-            df = pd.read_csv(file_path)
-            dfs.append(df)
+    With keep_latest=True only the newest snapshot (by scrape_timestamp) of
+    every key is kept, which is useful with a key that excludes the timestamp.
+    Returns the deduplicated frame and a report of the dropped rows.
+    """
+    fingerprint = row_fingerprint(df, key_columns)
 
-    combined_df = pd.concat(dfs, ignore_index=True)
-    combined_df.to_csv(r'./data/raw/raw_booking.csv', index=False)
+    if keep_latest:
+        # stable sort so ties keep their file order, then keep the last one
+        scrape_ts = pd.to_datetime(df["scrape_timestamp"]).fillna(pd.Timestamp.min).to_numpy()
+        order = np.argsort(scrape_ts, kind="stable")
+        dropped_sorted = pd.Series(fingerprint[order]).duplicated(keep="last").to_numpy()
+        dropped = np.empty_like(dropped_sorted)
+        dropped[order] = dropped_sorted
+    else:
+        dropped = pd.Series(fingerprint).duplicated(keep="first").to_numpy()
 
-    all_duplicates = combined_df[combined_df.duplicated(keep=False)]
-    if not all_duplicates.empty:
-        combined_df = combined_df.drop_duplicates()
+    report = {"key": list(key_columns), "rows_in": len(df), "dropped": {}}
+    n_dropped = int(dropped.sum())
+    if keep_latest and "scrape_timestamp" not in key_columns:
+        # split the drops between exact re-reads and older snapshots, in the same
+        # order as the dedup so the kept row is never counted as the re-read one
+        snapshot_key = list(key_columns) + ["scrape_timestamp"]
+        repeated_sorted = pd.Series(row_fingerprint(df, snapshot_key)[order]).duplicated(keep="last").to_numpy()
+        repeated = np.empty_like(repeated_sorted)
+        repeated[order] = repeated_sorted
+        report["dropped"]["duplicate_snapshot"] = int((dropped & repeated).sum())
+        report["dropped"]["older_snapshot"] = int((dropped & ~repeated).sum())
+    else:
+        report["dropped"]["duplicate_key"] = n_dropped
+    report["rows_out"] = len(df) - n_dropped
 
+    if n_dropped:
+        df = df[~dropped]
+    return df, report
 
+
+def list_raw_files(data_src_dir=RAW_DATA_DIR):
+    # sorted so the row order (and therefore dedup "first") is stable across runs
+    return [
+        os.path.join(data_src_dir, file)
+        for file in sorted(os.listdir(data_src_dir))
+        if file.endswith('.csv')
+    ]
+
+
+def raw_file_destinations(file_path):
+    """Destination part of a scraper output name ("marrakech", "marrakech-tangier"), None for other files"""
+    match = RAW_FILE_PATTERN.match(os.path.basename(file_path))
+    return match.group("destinations") if match else None
+
+
+def raw_file_date(file_path):
+    """Day a scraper output was started (YYYY-MM-DD), None for other files"""
+    match = RAW_FILE_PATTERN.match(os.path.basename(file_path))
+    return f"{match['date'][:4]}-{match['date'][4:6]}-{match['date'][6:]}" if match else None
+
+
+def destination_slug(destination):
+    # same lower-case form the scraper puts in its file names
+    return destination.lower()
+
+
+def destination_raw_files(destination, data_src_dir=RAW_DATA_DIR):
+    """Scraper outputs of one destination"""
+    return [f for f in list_raw_files(data_src_dir) if raw_file_destinations(f) == destination_slug(destination)]
+
+
+def other_raw_files(destinations, data_src_dir=RAW_DATA_DIR):
+    # files of several destinations (earlier runs) or of destinations no longer
+    # scraped, so the transforms of a run still cover every raw file
+    slugs = {destination_slug(destination) for destination in destinations}
+    return [
+        f for f in list_raw_files(data_src_dir)
+        if os.path.basename(f) != RAW_SNAPSHOT_FILE and raw_file_destinations(f) not in slugs
+    ]
+
+
+def normalize_timestamps(df):
     # Standardization of data types
     # Standardize scrape_timestamp to datetime format
     # converting scrape timestamp from object to datetime64
-    combined_df.scrape_timestamp = pd.to_datetime(combined_df.scrape_timestamp)
+    df.scrape_timestamp = pd.to_datetime(df.scrape_timestamp)
 
     # Timestamp Normalization
     # Converts Unix timestamps (in milliseconds) to ISO 8601 strings.
@@ -38,127 +121,273 @@ def transform():
             return datetime.fromtimestamp(ts / 1000, UTC).isoformat()
         return ts  # assume it's already a string
 
-    combined_df["scrape_timestamp"] = combined_df["scrape_timestamp"].map(normalize_timestamp)
+    df["scrape_timestamp"] = df["scrape_timestamp"].map(normalize_timestamp)
+
+    # Typed UTC timestamp for the warehouse (DIM_DATE, FACT), so the load does
+    # not have to convert scrape_timestamp. Naive times are UTC: the scraper
+    # containers run on UTC.
+    df.insert(df.columns.get_loc("scrape_timestamp") + 1, "normalized_timestamp",
+              pd.to_datetime(df["scrape_timestamp"], utc=True))
+    return df
 
 
+def fix_city_names(df):
     # Data Inconsistency in OSM Locations
     # OpenStreetMap (OSM) API data occasionally assigns the name of a nearby village
     # instead of the corresponding city name.
     #To address this data inconsistency, we will programmatically overwrite the village
     # name with the name of the city for those specific locations
-    combined_df.loc[combined_df.address.str.contains('Marrakech',na=False), 'city'] = 'Marrakech'
-    combined_df.loc[combined_df.address.str.contains('Tangier',na=False), 'city'] = 'Tangier'
+    df.loc[df.address.str.contains('Marrakech',na=False), 'city'] = 'Marrakech'
+    df.loc[df.address.str.contains('Tangier',na=False), 'city'] = 'Tangier'
+    return df
+
 
+def add_weighted_avg(df):
     # Create derived metric
     # Calculating weighted_avg
     weighted_avg = (
-                           combined_df.avg_review_score_families * combined_df.avg_review_score_families_count +
-                           combined_df.avg_review_score_couples * combined_df.avg_review_score_couples_count +
-                           combined_df.avg_review_score_solo_travelers * combined_df.avg_review_score_solo_travelers_count +
-                           combined_df.avg_review_score_business_travellers * combined_df.avg_review_score_business_travellers_count +
-                           combined_df.avg_review_score_groups_friends * combined_df.avg_review_score_groups_friends_count
+                           df.avg_review_score_families * df.avg_review_score_families_count +
+                           df.avg_review_score_couples * df.avg_review_score_couples_count +
+                           df.avg_review_score_solo_travelers * df.avg_review_score_solo_travelers_count +
+                           df.avg_review_score_business_travellers * df.avg_review_score_business_travellers_count +
+                           df.avg_review_score_groups_friends * df.avg_review_score_groups_friends_count
                    ) / (
-                           combined_df.avg_review_score_families_count +
-                           combined_df.avg_review_score_couples_count +
-                           combined_df.avg_review_score_solo_travelers_count +
-                           combined_df.avg_review_score_business_travellers_count +
-                           combined_df.avg_review_score_groups_friends_count
+                           df.avg_review_score_families_count +
+                           df.avg_review_score_couples_count +
+                           df.avg_review_score_solo_travelers_count +
+                           df.avg_review_score_business_travellers_count +
+                           df.avg_review_score_groups_friends_count
                    )
 
     # Find the index of the 'max_price' column
-    general_review_count_index = combined_df.columns.get_loc('general_review_count')
+    general_review_count_index = df.columns.get_loc('general_review_count')
 
     # Insert the new column right after 'max_price'
-    combined_df.insert(loc=general_review_count_index + 1, column='weighted_avg', value=weighted_avg)
-
-    # Check consistency between review counts and totals
-    combined_df['count_sum'] = (
-            combined_df.avg_review_score_families_count +
-            combined_df.avg_review_score_couples_count +
-            combined_df.avg_review_score_solo_travelers_count +
-            combined_df.avg_review_score_business_travellers_count +
-            combined_df.avg_review_score_groups_friends_count
-    )
-    combined_df.query('count_sum == avg_review_score_all_count')
-    combined_df.drop(columns=['count_sum'], inplace=True)
-
-    # Data Quality Checks
-    # Review Score Range Check
-    combined_df.query(
-        'avg_review_score_all > 0 and avg_review_score_all < 10 and '
-        'avg_review_score_families > 0 and avg_review_score_families < 10 and '
-        'avg_review_score_couples > 0 and avg_review_score_couples < 10 and '
-        'avg_review_score_solo_travelers > 0 and avg_review_score_solo_travelers < 10 and '
-        'avg_review_score_groups_friends > 0 and avg_review_score_groups_friends < 10 and '
-        'avg_review_score_business_travellers > 0 and avg_review_score_business_travellers < 10',
-        inplace=True
-    )
-
-    # Review Count Check
-    combined_df = combined_df.query(
-        "avg_review_score_all_count > 0 and \
-         avg_review_score_families_count > 0 and \
-         avg_review_score_couples_count > 0 and \
-         avg_review_score_solo_travelers_count > 0 and \
-         avg_review_score_groups_friends_count > 0 and \
-         avg_review_score_business_travellers_count > 0"
-    )
-
-    # Latitude & Longitude Validity
-    combined_df.query('latitude > -90 and latitude < 90 and longitude > -180 and longitude < 180', inplace=True)
-
-    # Price Validity
-    combined_df.query('min_price >= 0 and max_price >= min_price', inplace=True)
+    df.insert(loc=general_review_count_index + 1, column='weighted_avg', value=weighted_avg)
+    return df
 
-    # Handling missing values
-    # handling missing zone values
-    def get_zone_from_address(address):
-        if pd.isna(address):
-            return pd.NA
-
-        parts = [part.strip() for part in address.split('  ') if part.strip()]
-
-        # Expanded list of zone identifiers with different administrative levels
-        zone_identifiers = [
-            'Cercle de', 'Cercle d',
-            'Prefecture de', 'Prefecture d',
-            'Province de', 'Province d',
-            'Arrondissement de', 'Arrondissement d',
-            'cadat de', 'cadat d',
-            'Pachalik de', 'Pachalik d',
-            'Commune de', 'Commune d'
-        ]
-
-        for part in parts:
-            for identifier in zone_identifiers:
-                if part.startswith(identifier):
-                    return part
-
-        # As a last resort, return the administrative part before the region
-        # This is a fallback strategy
-        region_indicators = ['Marrakesh', 'Province', 'Prefecture']
-        for i, part in enumerate(parts):
-            if any(indicator in part for indicator in region_indicators) and i > 0:
-                return parts[i - 1]
 
+def get_zone_from_address(address):
+    if pd.isna(address):
         return pd.NA
 
+    parts = [part.strip() for part in address.split('  ') if part.strip()]
+
+    # Expanded list of zone identifiers with different administrative levels
+    zone_identifiers = [
+        'Cercle de', 'Cercle d',
+        'Prefecture de', 'Prefecture d',
+        'Province de', 'Province d',
+        'Arrondissement de', 'Arrondissement d',
+        'cadat de', 'cadat d',
+        'Pachalik de', 'Pachalik d',
+        'Commune de', 'Commune d'
+    ]
+
+    for part in parts:
+        for identifier in zone_identifiers:
+            if part.startswith(identifier):
+                return part
+
+    # As a last resort, return the administrative part before the region
+    # This is a fallback strategy
+    region_indicators = ['Marrakesh', 'Province', 'Prefecture']
+    for i, part in enumerate(parts):
+        if any(indicator in part for indicator in region_indicators) and i > 0:
+            return parts[i - 1]
+
+    return pd.NA
+
+
+def backfill_zones(df):
+    # Handling missing values
+    # handling missing zone values
     # Row Selection (mask): .loc[] uses the boolean mask to choose rows.
     # It will only return the rows where the mask is True.
     # In our case, only rows with a missing zone.
-    mask = combined_df['zone'].isna()
-    combined_df.loc[mask, 'zone'] = combined_df.loc[mask, 'address'].apply(get_zone_from_address)
-
-    timestamp = (datetime.now() - timedelta(hours=1)).strftime('%Y%m%d_%H%M%S') # right now minus one hour. so we can be like the image time GMT not GMT+1
-    combined_df.to_csv(f'./data/staging/staged_booking{timestamp}.csv', index=False)
-    # Read CSV into Arrow Table
-    table = pv.read_csv(f'./data/staging/staged_booking{timestamp}.csv')
-    # Write to Parquet
-    pq.write_table(table, f'./data/staging/staged_booking{timestamp}.parquet')
+    mask = df['zone'].isna()
+    df.loc[mask, 'zone'] = df.loc[mask, 'address'].apply(get_zone_from_address)
+    return df
+
+
+def transform_frame(df):
+    """Row-local transform steps, independent for every raw file.
+
+    Returns the transformed frame, the rows rejected by the quality rules and
+    the per-rule failure counts.
+    """
+    df = _traced_step(normalize_timestamps, df)
+    df = _traced_step(fix_city_names, df)
+    df = _traced_step(add_weighted_avg, df)
+    # Data Quality Checks, all rules evaluated in a single pass
+    df, quarantined, rule_counts = _traced_step(apply_quality_rules, df)
+    df = _traced_step(backfill_zones, df)
+    return df, quarantined, rule_counts
+
+
+def _traced_step(step, df):
+    with span(step.__name__, "transform", rows=len(df)):
+        return step(df)
+
+
+def read_raw_file(file_path):
+    # streamed micro-batches are parquet files typed by the scraper's record schema
+    if file_path.endswith('.parquet'):
+        return pq.read_table(file_path).to_pandas()
+    return pd.read_csv(file_path)
+
+
+def transform_file(file_path):
+    with span("transform_file", "transform", file=os.path.basename(file_path)) as trace:
+        with span("read_raw", "io", file=os.path.basename(file_path), bytes=os.path.getsize(file_path)) as read:
+            df = read_raw_file(file_path)
+            read["rows"] = len(df)
+        result = transform_frame(df)
+        trace["rows"] = len(result[0])
+        return result
+
+
+def file_bytes(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def transform_files(files, workers=TRANSFORM_WORKERS, chunk_size=TRANSFORM_CHUNK_SIZE):
+    """Run transform_file over every raw file, in a process pool when workers != 1.
+
+    Results come back in file order so the merged frame is the same as the serial one.
+    """
+    if workers == 1 or len(files) <= 1:
+        return [transform_file(file_path) for file_path in files]
+
+    workers = min(workers or os.cpu_count(), len(files))
+    # the workers trace their files as spans of their own processes
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(transform_file, files, chunksize=chunk_size))
+
+
+def write_raw_snapshot(files, data_src_dir=RAW_DATA_DIR):
+    """Rewrite raw_booking.csv as the union of the raw files.
+
+    The files are appended as text when they share the same header, which
+    avoids parsing them a second time in the parent process.
+    """
+    snapshot_path = os.path.join(data_src_dir, RAW_SNAPSHOT_FILE)
+    headers = set()
+    for file_path in files:
+        with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+            headers.add(csvfile.readline().rstrip('\r\n'))
+
+    # raw_booking.csv is one of the inputs, so write next to it and swap at the end
+    tmp_path = snapshot_path + '.tmp'
+    if len(headers) == 1:
+        with open(tmp_path, 'wb') as out:
+            for i, file_path in enumerate(files):
+                with open(file_path, 'rb') as src:
+                    header = src.readline()
+                    if i == 0:
+                        out.write(header)
+                    shutil.copyfileobj(src, out)
+                    # keep the next file from being glued onto a last line without newline
+                    if src.tell() > len(header):
+                        src.seek(-1, os.SEEK_END)
+                        if src.read(1) != b'\n':
+                            out.write(b'\n')
+    else:
+        pd.concat([pd.read_csv(file_path) for file_path in files], ignore_index=True).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, snapshot_path)
+    return snapshot_path
+
+
+def _traced_raw_snapshot(files):
+    with span("write_raw_snapshot", "io", files=len(files)) as trace:
+        trace["bytes"] = os.path.getsize(write_raw_snapshot(files, RAW_DATA_DIR))
+
+
+def _container_path(path):
+    # the flow runs from /opt/prefect inside the etl-pipeline container
+    return os.path.join("/opt/prefect", os.path.normpath(path))
+
+
+def staging_timestamp():
+    return (datetime.now() - timedelta(hours=1)).strftime('%Y%m%d_%H%M%S') # right now minus one hour. so we can be like the image time GMT not GMT+1
+
+
+@traced("transform", "transform")
+def transform(dedup_key=DEDUP_KEY, keep_latest=False, workers=TRANSFORM_WORKERS, chunk_size=TRANSFORM_CHUNK_SIZE,
+              engine=TRANSFORM_ENGINE, layout=STAGING_LAYOUT, files=None, output_path=None, part_name="part-0"):
+    """Transform the raw files into a new staging output and return its (container) path.
+
+    By default every raw file is transformed into a new staged_booking{timestamp}.
+    A subset of the raw files (one destination's) can instead be written into
+    a shared partitioned output, as {part_name}.parquet in each partition, so
+    several transforms fill the same staging output concurrently.
+    """
+    # the raw snapshot is the union of every raw file, only a full transform rewrites it
+    full_run = files is None
+    files = list_raw_files(RAW_DATA_DIR) if full_run else files
+    timestamp = staging_timestamp()
+    if output_path:
+        if layout != "partitioned":
+            raise ValueError("Only the partitioned staging layout can be shared by several transforms")
+        # concurrent transforms into one output each keep their own quarantine file
+        timestamp = f"{timestamp}_{part_name}"
+
+    if engine == "duckdb":
+        from .duckdb_engine import transform_duckdb
+        output_path = transform_duckdb(files, timestamp, STAGING_DIR, dedup_key, keep_latest, layout=layout,
+                                       output_path=output_path, part_name=part_name)
+        if full_run:
+            _traced_raw_snapshot(files)
+        return _container_path(output_path)
+    if engine != "pandas":
+        raise ValueError(f"Unknown transform engine: {engine}")
+
+    # file-local steps (parsing, timestamps, city fix-ups, weighted_avg,
+    # quality filters, zone backfill), in parallel when workers != 1
+    with span("transform_files", "transform", files=len(files), workers=workers):
+        results = transform_files(files, workers, chunk_size)
+    if full_run:
+        _traced_raw_snapshot(files)
+
+    combined_df = pd.concat([df for df, _, _ in results], ignore_index=True)
+    quarantined_df = pd.concat([quarantined for _, quarantined, _ in results], ignore_index=True)
+    rule_counts = {}
+    for _, _, counts in results:
+        for rule, count in counts.items():
+            rule_counts[rule] = rule_counts.get(rule, 0) + count
+
+    # Deduplication on the natural key (hashing datetime64 + the short
+    # canonical url instead of every column of every row), global across files
+    with span("deduplicate", "transform", rows=len(combined_df)):
+        combined_df, dedup_report = deduplicate(combined_df, dedup_key, keep_latest)
+    print(f"🧹 Deduplication on {dedup_report['key']}: {dedup_report['rows_in']} -> {dedup_report['rows_out']} rows, "
+          f"dropped {dedup_report['dropped']}")
+    # warehouse keys hashed from the natural keys, checked against the local key maps
+    combined_df = _traced_step(add_surrogate_keys, combined_df)
+    print(f"🔑 New dimension members: {_traced_step(update_key_maps, combined_df)}")
+
+    print(f"🔎 Quality rule failures: {rule_counts}")
+    with span("write_quarantine", "io", rows=len(quarantined_df)) as trace:
+        quarantine_path = write_quarantine(quarantined_df, timestamp)
+        trace["bytes"] = file_bytes([quarantine_path] if quarantine_path else [])
+    if quarantine_path:
+        print(f"🚧 Quarantined {len(quarantined_df)} rows into {quarantine_path}")
+
+    with span("write_staging", "io", rows=len(combined_df), layout=layout) as trace:
+        if layout == "partitioned":
+            output_path = output_path or staging_path(timestamp, STAGING_DIR, layout)
+            files_written = write_staging_dataset(pa.Table.from_pandas(combined_df, preserve_index=False), output_path,
+                                                  part_name=part_name)
+            print(f"🗂️ Wrote {len(files_written)} staging partitions into {output_path}")
+        else:
+            output_path = write_staging(combined_df, timestamp, STAGING_DIR)
+            files_written = [output_path]
+        trace["bytes"] = file_bytes(files_written)
     print(f"✅ Transformation complete. Final row count: {len(combined_df)}")
     print(f"✅ Transformation complete. Final columns count: {len(combined_df.columns)}")
-    parquet_file = pq.ParquetFile(f"./data/staging/staged_booking{timestamp}.parquet")
-    num_columns = len(parquet_file.schema.names)
-    print(f"🧮 Parquet column count: {num_columns}")
-    return f"/opt/prefect/data/staging/staged_booking{timestamp}.parquet"
-
+    staging_files = list_staging_files(output_path)
+    if staging_files:
+        parquet_file = pq.ParquetFile(staging_files[0])
+        num_columns = len(parquet_file.schema.names)
+        print(f"🧮 Parquet column count: {num_columns}")
+    return _container_path(output_path)
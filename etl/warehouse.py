@@ -0,0 +1,396 @@
+import contextvars
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+from .tracing import span
+
+# "snowflake": the Snowflake account from the .env file
+# "duckdb": a local DuckDB file with the same tables, for running / profiling the load without an account
+WAREHOUSE_BACKEND = os.getenv("WAREHOUSE_BACKEND", "snowflake")
+LOCAL_WAREHOUSE_PATH = os.getenv("LOCAL_WAREHOUSE_PATH", "./data/warehouse/booking.duckdb")
+
+STAGE_NAME = "booking_clean_data"
+# every statement sent to the warehouse is timed and appended here as one json line
+WAREHOUSE_TIMING_LOG = os.getenv("WAREHOUSE_TIMING_LOG", "./data/logs/warehouse_timings.jsonl")
+
+
+def sql_list(values):
+    return ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+
+
+def create_snowflake_session():
+    from snowflake.snowpark import Session
+
+    # Load environment variables from .env file
+    load_dotenv()
+
+    connection_parameters = {
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "role": os.getenv("SNOWFLAKE_ROLE"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DB"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+    }
+
+    # create the user session so I can run queries
+    session = Session.builder.configs(connection_parameters).create()
+    return session
+
+
+def _statement_label(query):
+    words = [w for w in query.split() if w.upper() not in ("IF", "NOT", "EXISTS")]
+    return " ".join(words[:4])
+
+
+class Warehouse:
+    """Statement timing shared by the backends, which implement _execute / _execute_script"""
+
+    name = None
+
+    def __init__(self):
+        self.timings = []
+
+    def _timed(self, label, run, query=None, **attrs):
+        started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+        try:
+            with span(label, "sql", backend=self.name, **attrs) as trace:
+                if query:
+                    trace["statement"] = " ".join(query.split())
+                result = run()
+                if isinstance(result, list):
+                    trace["result_rows"] = len(result)
+                return result
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings.append({"backend": self.name, "statement": label, "seconds": seconds, "started_at": started_at})
+            print(f"⏱️ {seconds:8.3f}s  {label}")
+
+    def sql(self, query):
+        return self._timed(_statement_label(query), lambda: self._execute(query), query)
+
+    def run_script(self, statements):
+        """Send idempotent statements (DDL, USE) as one multi-statement submission"""
+        if statements:
+            self._timed(f"BATCH of {len(statements)} statements", lambda: self._execute_script(statements))
+
+    def run_concurrently(self, queries):
+        """Submit independent statements together and wait for all of them.
+
+        Each statement is timed from its submission to its own completion, so
+        the log shows which one bounds the wall time of the group.
+        """
+        start = time.perf_counter()
+        waits = [(query, self._submit(query)) for query in queries]
+        with ThreadPoolExecutor(max_workers=max(len(waits), 1)) as pool:
+            # each statement runs in a copy of the caller's context, its span nests under the caller's
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._timed, _statement_label(query), wait, query)
+                for query, wait in waits
+            ]
+            results = [future.result() for future in futures]
+        print(f"⏱️ {time.perf_counter() - start:8.3f}s  {len(queries)} concurrent statements")
+        return results
+
+    def run_transaction(self, queries):
+        """Run statements in order in one transaction, so either all of them apply or none does"""
+        self.sql("BEGIN TRANSACTION")
+        try:
+            results = [self.sql(query) for query in queries]
+        except Exception:
+            self.sql("ROLLBACK")
+            raise
+        self.sql("COMMIT")
+        return results
+
+    def print_timings(self):
+        total = sum(t["seconds"] for t in self.timings)
+        print(f"⏱️ {len(self.timings)} warehouse statements in {total:.3f}s, slowest:")
+        for t in sorted(self.timings, key=lambda t: t["seconds"], reverse=True)[:10]:
+            print(f"    {t['seconds']:8.3f}s  {t['statement']}")
+
+    def write_timings(self, path=WAREHOUSE_TIMING_LOG):
+        if not path or not self.timings:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a") as f:
+            for t in self.timings:
+                f.write(json.dumps(t) + "\n")
+
+    def close(self):
+        self.print_timings()
+        self.write_timings()
+        self._close()
+
+
+class SnowflakeWarehouse(Warehouse):
+    """BOOKING_DB on Snowflake, through a Snowpark session"""
+
+    name = "snowflake"
+    temporary_table = "TEMPORARY TABLE"
+
+    def __init__(self, session=None):
+        super().__init__()
+        self.session = session or self._timed("LOGIN", create_snowflake_session)
+
+    def _execute(self, query):
+        return self.session.sql(query).collect()
+
+    def _submit(self, query):
+        # async query on the same session, it sees the session's temporary tables
+        return self.session.sql(query).collect_nowait().result
+
+    def _execute_script(self, statements):
+        # a single request, the server runs the statements in order (num_statements must match)
+        with self.session.connection.cursor() as cursor:
+            cursor.execute(";\n".join(statements), num_statements=len(statements))
+
+    def setup_statements(self):
+        #create the resources I will use to load my data
+        return [
+            "CREATE WAREHOUSE IF NOT EXISTS BOOKING_WH",
+            "USE WAREHOUSE BOOKING_WH",
+            "CREATE DATABASE IF NOT EXISTS BOOKING_DB",
+            "USE DATABASE BOOKING_DB",
+            # staging timestamps are UTC instants, casting them to TIMESTAMP_NTZ keeps the UTC wall time
+            "ALTER SESSION SET TIMEZONE = 'UTC'",
+        ]
+
+    def schema_statements(self, schema):
+        return [f"CREATE SCHEMA IF NOT EXISTS {schema}", f"USE SCHEMA {schema}"]
+
+    def stage_statements(self):
+        return [
+            # logical types: parquet timestamps are loaded as timestamps, not epoch numbers
+            "CREATE OR REPLACE FILE FORMAT booking_parquet TYPE = PARQUET USE_LOGICAL_TYPE = TRUE",
+            f"CREATE STAGE IF NOT EXISTS {STAGE_NAME}",
+        ]
+
+    def clear_stage(self):
+        self.sql(f"REMOVE @{STAGE_NAME}")
+
+    def upload(self, local_file, stage_file):
+        def put():
+            with open(local_file, "rb") as f:
+                self.session.file.put_stream(f, f"@{STAGE_NAME}/{stage_file}", auto_compress=False, overwrite=True)
+        self._timed(f"PUT {stage_file}", put, bytes=os.path.getsize(local_file))
+
+    def create_table_from_file(self, table, stage_file):
+        # column names and types inferred from the parquet schema
+        self.sql(f"""
+                CREATE TABLE IF NOT EXISTS {table} USING TEMPLATE (
+                    SELECT ARRAY_AGG(OBJECT_CONSTRUCT(*))
+                    FROM TABLE(INFER_SCHEMA(
+                        LOCATION => '@{STAGE_NAME}',
+                        FILE_FORMAT => 'booking_parquet',
+                        FILES => '{stage_file}'
+                    ))
+                )
+                """)
+
+    def copy_files(self, table, stage_files, file_column):
+        """Append staged files to a table, returns the loaded row count per file"""
+        rows_loaded = {}
+        # COPY INTO accepts at most 1000 files in its FILES list
+        for i in range(0, len(stage_files), 1000):
+            for row in self.sql(f"""
+                        COPY INTO {table}
+                        FROM @{STAGE_NAME}
+                        FILES = ({sql_list(stage_files[i:i + 1000])})
+                        FILE_FORMAT = (FORMAT_NAME = 'booking_parquet')
+                        MATCH_BY_COLUMN_NAME = CASE_SENSITIVE
+                        INCLUDE_METADATA = ("{file_column}" = METADATA$FILENAME)
+                        PURGE = TRUE
+                        """):
+                rows_loaded[row["file"]] = row["rows_loaded"]
+        return rows_loaded
+
+    def identity_statements(self, table):
+        return []
+
+    def identity_column(self, table):
+        return "INT IDENTITY(1,1)"
+
+    def cluster_statements(self, table, columns):
+        # automatic clustering keeps micro-partitions sorted on the key as rows arrive
+        return [f"ALTER TABLE {table} CLUSTER BY ({', '.join(columns)})"]
+
+    def export_partitions(self, table, partition_by, partitions_query):
+        # the table's own micro-partitions are pruned on the clustering key, nothing to write
+        pass
+
+    def clear_exports(self):
+        pass
+
+    def _close(self):
+        self.session.close()
+
+
+class DuckDBWarehouse(Warehouse):
+    """BOOKING_DB as a local DuckDB file, running the same SQL as the Snowflake backend.
+
+    The stage is a directory next to the database file, and the few Snowflake
+    only constructs (IDENTITY columns, TIMESTAMP_NTZ, COPY INTO a stage) have
+    local equivalents below.
+    """
+
+    name = "duckdb"
+    # concurrent statements run on other connections, which cannot see this one's temporary tables
+    temporary_table = "TABLE"
+
+    def __init__(self, path=LOCAL_WAREHOUSE_PATH):
+        import duckdb
+
+        super().__init__()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.stage_dir = os.path.join(os.path.dirname(os.path.abspath(path)), STAGE_NAME)
+        # parquet copies of the tables, partitioned like the Snowflake clustering keys
+        self.export_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "parquet")
+        self.con = duckdb.connect()
+        self.con.execute(f"ATTACH {sql_list([path])} AS BOOKING_DB")
+        self.con.execute("USE BOOKING_DB")
+        if not self.con.execute(
+                "SELECT 1 FROM duckdb_types() WHERE database_name = 'BOOKING_DB' AND type_name = 'TIMESTAMP_NTZ'").fetchall():
+            self.con.execute("CREATE TYPE TIMESTAMP_NTZ AS TIMESTAMP")
+
+    def _execute(self, query):
+        return self.con.execute(query).fetchall()
+
+    def _submit(self, query):
+        # a cursor is a new connection to the same database, running in its own thread
+        cursor = self.con.cursor()
+        database, schema = self.con.execute("SELECT current_database(), current_schema()").fetchone()
+        cursor.execute(";\n".join(self.setup_statements() + [f"USE {database}.{schema}"]))
+
+        def wait():
+            try:
+                return cursor.execute(query).fetchall()
+            finally:
+                cursor.close()
+        return wait
+
+    def _execute_script(self, statements):
+        # duckdb runs every statement of a multi-statement string
+        self.con.execute(";\n".join(statements))
+
+    def setup_statements(self):
+        return ["USE BOOKING_DB", "SET TimeZone = 'UTC'"]
+
+    def schema_statements(self, schema):
+        return [f"CREATE SCHEMA IF NOT EXISTS {schema}", f"USE BOOKING_DB.{schema}"]
+
+    def stage_statements(self):
+        os.makedirs(self.stage_dir, exist_ok=True)
+        return []
+
+    def clear_stage(self):
+        shutil.rmtree(self.stage_dir, ignore_errors=True)
+        os.makedirs(self.stage_dir, exist_ok=True)
+
+    def upload(self, local_file, stage_file):
+        self._timed(f"PUT {stage_file}", lambda: shutil.copyfile(local_file, os.path.join(self.stage_dir, stage_file)),
+                    bytes=os.path.getsize(local_file))
+
+    def create_table_from_file(self, table, stage_file):
+        self.sql(f"""
+                CREATE TABLE IF NOT EXISTS {table} AS
+                SELECT * FROM read_parquet({sql_list([os.path.join(self.stage_dir, stage_file)])}) LIMIT 0
+                """)
+
+    def copy_files(self, table, stage_files, file_column):
+        paths = [os.path.join(self.stage_dir, stage_file) for stage_file in stage_files]
+        self.sql(f"""
+                INSERT INTO {table} BY NAME
+                SELECT * EXCLUDE (filename), parse_filename(filename) AS "{file_column}"
+                FROM read_parquet([{sql_list(paths)}], filename = true, union_by_name = true)
+                """)
+        rows_loaded = dict(self.sql(f"""
+                SELECT "{file_column}", count(*) FROM {table}
+                WHERE "{file_column}" IN ({sql_list(stage_files)}) GROUP BY ALL
+                """))
+        # same as COPY INTO ... PURGE = TRUE
+        for path in paths:
+            os.remove(path)
+        return rows_loaded
+
+    def identity_statements(self, table):
+        return [f"CREATE SEQUENCE IF NOT EXISTS {table}_SEQ"]
+
+    def identity_column(self, table):
+        return f"INT DEFAULT nextval('{table}_SEQ')"
+
+    def cluster_statements(self, table, columns):
+        # no clustering keys, rows are inserted in key order so row group zonemaps prune instead
+        return []
+
+    def export_partitions(self, table, partition_by, partitions_query):
+        """Rewrite the Hive partitions of {export_dir}/{table} listed by partitions_query.
+
+        The first export writes every partition of the table, later ones only
+        the partitions the query returns (those touched by the last batch).
+        """
+        directory = os.path.join(self.export_dir, table)
+        columns = ", ".join(partition_by)
+        if not os.path.isdir(directory):
+            partitions_query = f"SELECT DISTINCT {columns} FROM {table}"
+        partitions = self.sql(partitions_query)
+        for values in partitions:
+            shutil.rmtree(os.path.join(directory, *(f"{c}={v}" for c, v in zip(partition_by, values))),
+                          ignore_errors=True)
+        if not partitions:
+            return
+        os.makedirs(self.export_dir, exist_ok=True)
+        self.sql(f"""
+                COPY (
+                    SELECT t.* FROM {table} t SEMI JOIN ({partitions_query}) p USING ({columns})
+                    ORDER BY {columns}
+                ) TO {sql_list([directory])}
+                (FORMAT parquet, COMPRESSION zstd, PARTITION_BY ({columns}), OVERWRITE_OR_IGNORE, FILENAME_PATTERN 'part-{{i}}')
+                """)
+
+    def clear_exports(self):
+        # a rebuilt table is exported again in full
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+
+    def _close(self):
+        self.con.close()
+
+
+def connect_warehouse(backend=WAREHOUSE_BACKEND):
+    if backend == "duckdb":
+        return DuckDBWarehouse()
+    if backend == "snowflake":
+        return SnowflakeWarehouse()
+    raise ValueError(f"Unknown warehouse backend: {backend}")
+
+
+# connections opened by warehouse_session, one per backend
+_open_sessions = {}
+
+
+@contextmanager
+def warehouse_session(backend=WAREHOUSE_BACKEND):
+    """One authenticated connection shared by everything that runs inside it.
+
+    Nested sessions on the same backend reuse the outer connection, so the
+    flow can wrap the load and the modeling in a single login; the connection
+    is closed (and its timings reported) when the outermost session exits.
+    """
+    if backend in _open_sessions:
+        yield _open_sessions[backend]
+        return
+    warehouse = connect_warehouse(backend)
+    _open_sessions[backend] = warehouse
+    try:
+        yield warehouse
+    finally:
+        del _open_sessions[backend]
+        warehouse.close()
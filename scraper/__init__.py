@@ -1,2 +1,22 @@
-from .multi_thread_booking_scraper import scrape_booking_properties
-from .multi_thread_booking_scraper import scrape_single_threaded
+import importlib
+
+# imported on first access (PEP 562): selenium and requests are only loaded by the processes that scrape
+_LAZY_ATTRIBUTES = {
+    "scrape_booking_properties": ".multi_thread_booking_scraper",
+    "scrape_single_threaded": ".multi_thread_booking_scraper",
+    "PropertyRecord": ".property_record",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -15,16 +15,44 @@ from collections import defaultdict
 import requests
 from datetime import date, timedelta, datetime
 from selenium.common.exceptions import TimeoutException
+from etl.tracing import span, trace_run, traced
+from scraper.property_record import FIELDNAMES, PropertyRecord, write_records
 
 # Global lock for CSV writing
 csv_lock = threading.Lock()
 
 # === TESTING LIMITS ===
 # Set these to None or 0 to disable the limits
-TEST_MAX_PROPERTIES = 100
 TEST_MAX_REVIEW_PAGES = 5
 
+# The settings below are read from the environment when used, not at import, so a
+# harness (benchmarks/scraper_load_test.py) can point an already imported scraper
+# at a local fixture server (benchmarks/booking_fixture_server.py).
+DEFAULT_MAX_PROPERTIES = "100"
+DEFAULT_BOOKING_BASE_URL = "https://www.booking.com"
+DEFAULT_NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
+# output directory of the multi-threaded scraper
+DEFAULT_RESULTS_DIR = "/app/results"
 
+
+def max_properties_limit():
+    # SCRAPER_MAX_PROPERTIES=0 disables the testing limit
+    return int(os.getenv("SCRAPER_MAX_PROPERTIES", DEFAULT_MAX_PROPERTIES)) or 500
+
+
+def booking_base_url():
+    return os.getenv("BOOKING_BASE_URL", DEFAULT_BOOKING_BASE_URL)
+
+
+def nominatim_url():
+    return os.getenv("NOMINATIM_URL", DEFAULT_NOMINATIM_URL)
+
+
+def results_dir():
+    return os.getenv("SCRAPER_RESULTS_DIR", DEFAULT_RESULTS_DIR)
+
+
+@traced(category="scrape")
 def init_driver():
     """Initialize and return a remote Chrome WebDriver."""
     chrome_options = Options()
@@ -58,9 +86,10 @@ def init_driver():
     return driver
 
 
+@traced(category="scrape")
 def build_urls(destinations):
     """Build search URLs for multiple destinations"""
-    base_url = "https://www.booking.com/searchresults.html?"
+    base_url = f"{booking_base_url()}/searchresults.html?"
     today = date.today()
     tomorrow = today + timedelta(days=1)
 
@@ -80,6 +109,7 @@ def build_urls(destinations):
     return urls
 
 
+@traced(category="scrape")
 def scrape_property_urls(urls, max_links=500):
     """Scrape property URLs from search results until reaching max_links"""
     driver = init_driver()
@@ -380,11 +410,12 @@ def process_specific_traveler_category(driver, category_value, prefix=""):
     return scores
 
 
+@traced(category="http")
 def get_location_details(lat, lon):
     """Reverse-geocode latitude/longitude to address, zone and city (using Nominatim)."""
     try:
         url = (
-            "https://nominatim.openstreetmap.org/reverse?format=json"
+            f"{nominatim_url()}?format=json"
             f"&lat={lat}&lon={lon}&accept-language=en"
         )
         headers = {
@@ -533,63 +564,39 @@ def extract_coordinates(page_source):
     return None, None
 
 
+@traced(category="scrape")
 def scrape_property_data(driver, url, thread_id=None):
     """Scrape detailed data for a single property"""
     prefix = f"Thread {thread_id}: " if thread_id else ""
     print(f"{prefix}Scraping: {url}")
 
-    data = {
-        'property_id': str(uuid.uuid4()),
-        'scrape_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'property_url': url,
-        'category': None,
-        'general_review': None,
-        'general_review_count': None,
-        'comfort_score': None,
-        'value_score': None,
-        'location_score': None,
-        'wifi_score': None,
-        'avg_review_score_all': None,
-        'avg_review_score_all_count': None,
-        'avg_review_score_families': None,
-        'avg_review_score_families_count': None,
-        'avg_review_score_couples': None,
-        'avg_review_score_couples_count': None,
-        'avg_review_score_solo_travelers': None,
-        'avg_review_score_solo_travelers_count': None,
-        'avg_review_score_business_travellers': None,
-        'avg_review_score_business_travellers_count': None,
-        'min_price': None,
-        'max_price': None,
-        'latitude': None,
-        'longitude': None,
-        'address': None,
-        'zone': None,
-        'city': None,
-        'wifi_speed': None,
-    }
+    data = PropertyRecord(
+        property_id=str(uuid.uuid4()),
+        scrape_timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        property_url=url,
+    )
 
     try:
         driver.get(url)
         time.sleep(2)
 
         # Extract category
-        data['category'] = extract_category(driver)
+        data.category = extract_category(driver)
 
         # Extract prices (min_price & max_price)
         try:
             min_p, max_p = extract_prices(driver)
-            data['min_price'] = min_p
-            data['max_price'] = max_p
+            data.min_price = min_p
+            data.max_price = max_p
         except Exception as e:
             print(f"{prefix}Error extracting prices: {e}")
 
         # Extract WiFi speed
         try:
             speed_element = driver.find_element(By.XPATH, "//div[contains(text(), 'Mbps')]")
-            data['wifi_speed'] = speed_element.text.split('•')[-1].strip()
+            data.wifi_speed = speed_element.text.split('•')[-1].strip()
         except:
-            data['wifi_speed'] = 'Not specified'
+            data.wifi_speed = 'Not specified'
 
         # Extract reviews and process by traveler type
         try:
@@ -648,7 +655,7 @@ def scrape_property_data(driver, url, thread_id=None):
             for score_key, xpath in score_xpaths:
                 try:
                     element = WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.XPATH, xpath)))
-                    data[score_key] = float(element.get_attribute("textContent"))
+                    data.set(score_key, float(element.get_attribute("textContent")))
                 except:
                     pass
 
@@ -658,7 +665,7 @@ def scrape_property_data(driver, url, thread_id=None):
                     EC.presence_of_element_located(
                         (By.XPATH, '//*[@id="js--hp-gallery-scorecard"]/a/div/div/div/div[2]'))
                 )
-                data['general_review'] = float(general_element.get_attribute("textContent"))
+                data.general_review = float(general_element.get_attribute("textContent"))
             except:
                 pass
 
@@ -667,7 +674,7 @@ def scrape_property_data(driver, url, thread_id=None):
                                                     '//*[@id="js--hp-gallery-scorecard"]/a/div/div/div/div[4]/div[2]')
                 count_text = ''.join(filter(str.isdigit, count_element.text))
                 if count_text:
-                    data['general_review_count'] = int(count_text)
+                    data.general_review_count = int(count_text)
             except:
                 pass
 
@@ -682,11 +689,11 @@ def scrape_property_data(driver, url, thread_id=None):
                     score_field = f'avg_review_score_{normalized_type}'
                     count_field = f'avg_review_score_{normalized_type}_count'
 
-                    # Ensure the field exists in our data structure
-                    data[score_field] = sum(scores) / len(scores)
-                    data[count_field] = len(scores)
+                    # A traveler type outside the schema is kept in the record's extra fields
+                    data.set(score_field, sum(scores) / len(scores))
+                    data.set(count_field, len(scores))
 
-                    print(f"{prefix}{traveler_type} -> {score_field}: {data[score_field]:.2f} ({len(scores)} reviews)")
+                    print(f"{prefix}{traveler_type} -> {score_field}: {sum(scores) / len(scores):.2f} ({len(scores)} reviews)")
 
             # Also set the 'all' category data if we have traveler scores
             all_scores = []
@@ -694,9 +701,9 @@ def scrape_property_data(driver, url, thread_id=None):
                 all_scores.extend(scores)
 
             if all_scores:
-                data['avg_review_score_all'] = sum(all_scores) / len(all_scores)
-                data['avg_review_score_all_count'] = len(all_scores)
-                print(f"{prefix}All travelers: {data['avg_review_score_all']:.2f} ({len(all_scores)} reviews)")
+                data.avg_review_score_all = sum(all_scores) / len(all_scores)
+                data.avg_review_score_all_count = len(all_scores)
+                print(f"{prefix}All travelers: {data.avg_review_score_all:.2f} ({len(all_scores)} reviews)")
 
             # Close the reviews tab/window and switch back to property page if we opened a new one
             if new_window:
@@ -713,8 +720,8 @@ def scrape_property_data(driver, url, thread_id=None):
         try:
             lat, lon = extract_coordinates(driver.page_source)
             if lat and lon:
-                data['latitude'] = lat
-                data['longitude'] = lon
+                data.latitude = lat
+                data.longitude = lon
 
                 location = get_location_details(lat, lon)
                 data.update(location)
@@ -729,57 +736,19 @@ def scrape_property_data(driver, url, thread_id=None):
 
 def get_all_possible_fields():
     """Define all possible CSV fields to ensure consistent column ordering"""
-    return [
-        'property_id',
-        'scrape_timestamp',
-        'property_url',
-        'category',
-        'general_review',
-        'general_review_count',
-        'comfort_score',
-        'value_score',
-        'location_score',
-        'wifi_score',
-        'avg_review_score_all',
-        'avg_review_score_all_count',
-        'avg_review_score_families',
-        'avg_review_score_families_count',
-        'avg_review_score_couples',
-        'avg_review_score_couples_count',
-        'avg_review_score_solo_travelers',
-        'avg_review_score_solo_travelers_count',
-        'avg_review_score_business_travellers',
-        'avg_review_score_business_travellers_count',
-        'avg_review_score_groups_friends',
-        'avg_review_score_groups_friends_count',
-        'min_price',
-        'max_price',
-        'latitude',
-        'longitude',
-        'address',
-        'zone',
-        'city',
-        'wifi_speed'
-    ]
+    return list(FIELDNAMES)
 
 
 def save_to_csv(data_list, filename):
-    """Thread-safe CSV writing with proper field handling"""
+    """Thread-safe CSV writing of property records, missing values written as their schema default"""
     if not data_list:
         return
 
-    # Use predefined field order
-    base_fields = get_all_possible_fields()
-
-    # Also collect any dynamic fields from the data
+    # Schema fields first, then any traveler type found outside the schema
     dynamic_fields = set()
-    for item in data_list:
-        for key in item.keys():
-            if key not in base_fields:
-                dynamic_fields.add(key)
-
-    # Combine base fields with any new dynamic fields
-    fieldnames = base_fields + sorted(list(dynamic_fields))
+    for record in data_list:
+        dynamic_fields.update(record.extra or ())
+    fieldnames = get_all_possible_fields() + sorted(dynamic_fields)
 
     with csv_lock:
         # Check if file exists and get existing headers
@@ -788,52 +757,54 @@ def save_to_csv(data_list, filename):
 
         try:
             with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                existing_fieldnames = reader.fieldnames or []
+                existing_fieldnames = next(csv.reader(csvfile), [])
                 file_exists = True
         except FileNotFoundError:
             pass
 
         # If file exists, merge fieldnames to include any new fields
         if file_exists and existing_fieldnames:
-            all_fieldnames = list(existing_fieldnames)
-            for field in fieldnames:
-                if field not in all_fieldnames:
-                    all_fieldnames.append(field)
-            fieldnames = all_fieldnames
+            fieldnames = existing_fieldnames + [field for field in fieldnames if field not in existing_fieldnames]
 
-        mode = 'a' if file_exists else 'w'
+        # the records write themselves in schema order unless the columns differ
+        columns = None if fieldnames == FIELDNAMES else fieldnames
 
-        with open(filename, mode, newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        with open(filename, 'a' if file_exists else 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
 
             # Write header only for new files
             if not file_exists:
-                writer.writeheader()
-
-            for item in data_list:
-                # Prepare row with proper default values
-                row = {}
-                for field in fieldnames:
-                    if field in item and item[field] is not None:
-                        row[field] = item[field]
-                    else:
-                        # Set appropriate default values
-                        if field == 'property_url':
-                            row[field] = item.get('property_url', '')
-                        elif field in ['category', 'address', 'zone', 'city', 'wifi_speed']:
-                            row[field] = ''  # Empty string instead of None for text fields
-                        elif field in ['latitude', 'longitude']:
-                            row[field] = ''  # Empty string for coordinates
-                        else:
-                            row[field] = 0  # Zero for numeric fields
-
-                writer.writerow(row)
+                writer.writerow(fieldnames)
+            writer.writerows(record.row(columns) for record in data_list)
 
     print(f"Saved {len(data_list)} properties to {filename}")
 
 
-def worker_thread(urls_chunk, thread_id, filename, batch_size=5):
+def save_batch(batch, filename, spool=None):
+    """Append a batch to the run's csv, and put it on the streaming queue as a typed parquet file"""
+    with span("save_to_csv", "io", rows=len(batch)) as trace:
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        save_to_csv(batch, filename)
+        trace["bytes"] = (os.path.getsize(filename) if os.path.exists(filename) else 0) - size
+    if spool is not None and batch:
+        # the transform consumer reads it with the record schema, no type inference
+        item = spool.new_item(".parquet")
+        with span("write_records", "io", rows=len(batch)) as trace:
+            write_records(batch, item)
+            trace["bytes"] = os.path.getsize(item)
+        spool.put(item)
+
+
+def streaming_spool(stream):
+    """Raw queue of the streaming mode, None when the scrape is not streamed"""
+    if not stream:
+        return None
+    from etl.streaming import RAW_QUEUE, SpoolQueue
+    return SpoolQueue(RAW_QUEUE)
+
+
+@traced(category="scrape")
+def worker_thread(urls_chunk, thread_id, filename, batch_size=5, spool=None):
     """Worker function for threading"""
     print(f"Thread {thread_id}: Starting with {len(urls_chunk)} properties")
 
@@ -851,7 +822,7 @@ def worker_thread(urls_chunk, thread_id, filename, batch_size=5):
 
                 # Save batch when full or last item
                 if len(batch) >= batch_size or i == len(urls_chunk):
-                    save_to_csv(batch, filename)
+                    save_batch(batch, filename, spool)
                     batch = []
 
                 time.sleep(1)  # Small delay between requests
@@ -863,17 +834,22 @@ def worker_thread(urls_chunk, thread_id, filename, batch_size=5):
     except KeyboardInterrupt:
         print(f"Thread {thread_id}: Interrupted")
         if batch:
-            save_to_csv(batch, filename)
+            save_batch(batch, filename, spool)
+            # saved once, not again by the finally block
+            batch = []
 
     finally:
         if batch:
-            save_to_csv(batch, filename)
+            save_batch(batch, filename, spool)
         driver.quit()
         print(f"Thread {thread_id}: Completed - processed {processed} properties")
 
 
-def scrape_booking_properties(destinations, num_threads=3, batch_size=5):
-    """Main scraping function"""
+@traced(category="scrape")
+def scrape_booking_properties(destinations, num_threads=3, batch_size=5, stream=False):
+    """Main scraping function, returns the csv written (None when nothing was found).
+
+    stream=True also puts every batch on the streaming queue."""
     print("=== BOOKING.COM SCRAPER ===")
 
     # Generate URLs
@@ -884,8 +860,7 @@ def scrape_booking_properties(destinations, num_threads=3, batch_size=5):
     print("Scraping property URLs...")
 
     # Apply testing limit if set
-    max_properties = TEST_MAX_PROPERTIES if TEST_MAX_PROPERTIES else 500
-    property_urls = scrape_property_urls(search_urls, max_links=max_properties)
+    property_urls = scrape_property_urls(search_urls, max_links=max_properties_limit())
 
     print(f"Found {len(property_urls)} properties")
 
@@ -915,14 +890,16 @@ def scrape_booking_properties(destinations, num_threads=3, batch_size=5):
 
     # Setup output file with timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'/app/results/booking_properties_{"-".join(destinations).lower()}_{timestamp}.csv'
+    filename = f'{results_dir()}/booking_properties_{"-".join(destinations).lower()}_{timestamp}.csv'
+
+    spool = streaming_spool(stream)
 
     # Start threads
     print(f"Starting {len(url_chunks)} threads...")
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
         futures = []
         for i, chunk in enumerate(url_chunks):
-            future = executor.submit(worker_thread, chunk, i + 1, filename, batch_size)
+            future = executor.submit(worker_thread, chunk, i + 1, filename, batch_size, spool)
             futures.append(future)
 
         # Wait for completion
@@ -935,17 +912,20 @@ def scrape_booking_properties(destinations, num_threads=3, batch_size=5):
 
     print(f"\n=== SCRAPING COMPLETED ===")
     print(f"Results saved to: {filename}")
+    return filename
 
 
-def scrape_single_threaded(destinations, batch_size=10):
-    """Single-threaded version for comparison"""
+@traced(category="scrape")
+def scrape_single_threaded(destinations, batch_size=10, stream=False):
+    """Single-threaded version for comparison, returns the raw csv written (None when nothing was found).
+
+    stream=True also puts every batch on the streaming queue (etl.streaming)."""
     print("=== SINGLE-THREADED SCRAPER ===")
 
     search_urls = build_urls(destinations)
 
     # Apply testing limit if set
-    max_properties = TEST_MAX_PROPERTIES if TEST_MAX_PROPERTIES else 500
-    property_urls = scrape_property_urls(search_urls, max_links=max_properties)
+    property_urls = scrape_property_urls(search_urls, max_links=max_properties_limit())
 
     if not property_urls:
         print("No properties found")
@@ -954,6 +934,7 @@ def scrape_single_threaded(destinations, batch_size=10):
     print(f"Found {len(property_urls)} properties")
 
     driver = init_driver()
+    spool = streaming_spool(stream)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     # pwd : opt/prefect
     filename = f'./data/raw/booking_properties_single_{"-".join(destinations).lower()}_{timestamp}.csv'
@@ -971,7 +952,7 @@ def scrape_single_threaded(destinations, batch_size=10):
                 processed += 1
 
                 if len(batch) >= batch_size or i == len(property_urls):
-                    save_to_csv(batch, filename)
+                    save_batch(batch, filename, spool)
                     print(
                         f"Saved batch. Progress: {processed}/{len(property_urls)} ({processed / len(property_urls) * 100:.1f}%)")
                     batch = []
@@ -985,15 +966,19 @@ def scrape_single_threaded(destinations, batch_size=10):
     except KeyboardInterrupt:
         print("Interrupted by user")
         if batch:
-            save_to_csv(batch, filename)
+            save_batch(batch, filename, spool)
+            # saved once, not again by the finally block
+            batch = []
 
     finally:
         if batch:
-            save_to_csv(batch, filename)
+            save_batch(batch, filename, spool)
         driver.quit()
         print(f"\nCompleted: {processed}/{len(property_urls)} properties")
         print(f"Results saved to: {filename}")
 
+    return filename
+
 
 if __name__ == "__main__":
     # Set environment variable to indicate running in Docker
@@ -1001,5 +986,6 @@ if __name__ == "__main__":
     cities = ["Marrakech", "Tangier"]
 
 
-    # scrape_booking_properties(cities, num_threads=3, batch_size=5)
-    scrape_single_threaded(cities, batch_size=5)
+    with trace_run("scraper"):
+        # scrape_booking_properties(cities, num_threads=3, batch_size=5)
+        scrape_single_threaded(cities, batch_size=5)
@@ -0,0 +1,110 @@
+import dataclasses
+from operator import attrgetter
+
+STRING, FLOAT, INT = "string", "float64", "int64"
+
+# The raw csv columns, in order: name, arrow type and the value written when the
+# scraper found nothing (text fields and coordinates empty, numeric fields 0).
+# PropertyRecord, the csv header and the arrow schema are all generated from it.
+PROPERTY_SCHEMA = [
+    ("property_id", STRING, ""),
+    ("scrape_timestamp", STRING, ""),
+    ("property_url", STRING, ""),
+    ("category", STRING, ""),
+    ("general_review", FLOAT, 0),
+    ("general_review_count", INT, 0),
+    ("comfort_score", FLOAT, 0),
+    ("value_score", FLOAT, 0),
+    ("location_score", FLOAT, 0),
+    ("wifi_score", FLOAT, 0),
+    *[(f"avg_review_score_{traveler_type}{suffix}", arrow_type, 0)
+      for traveler_type in ["all", "families", "couples", "solo_travelers", "business_travellers", "groups_friends"]
+      for suffix, arrow_type in [("", FLOAT), ("_count", INT)]],
+    ("min_price", INT, 0),
+    ("max_price", INT, 0),
+    ("latitude", FLOAT, ""),
+    ("longitude", FLOAT, ""),
+    ("address", STRING, ""),
+    ("zone", STRING, ""),
+    ("city", STRING, ""),
+    ("wifi_speed", STRING, ""),
+]
+
+FIELDNAMES = [name for name, _, _ in PROPERTY_SCHEMA]
+MISSING_VALUES = [missing for _, _, missing in PROPERTY_SCHEMA]
+_MISSING = dict(zip(FIELDNAMES, MISSING_VALUES))
+_PYTHON_TYPES = {STRING: str, FLOAT: float, INT: int}
+_values = attrgetter(*FIELDNAMES)
+
+
+def _set(self, name, value):
+    """Set a field by name; a field outside the schema (a new traveler type) goes to extra"""
+    if name in _MISSING:
+        setattr(self, name, value)
+    else:
+        if self.extra is None:
+            self.extra = {}
+        self.extra[name] = value
+
+
+def _update(self, values):
+    for name, value in values.items():
+        self.set(name, value)
+
+
+def _as_dict(self):
+    return {**dict(zip(FIELDNAMES, _values(self))), **(self.extra or {})}
+
+
+def _row(self, fieldnames=None):
+    """The csv values of the record (in schema order by default), missing ones written as
+    their schema default and 0 outside the schema"""
+    if fieldnames is None and not self.extra:
+        return [missing if value is None else value for value, missing in zip(_values(self), MISSING_VALUES)]
+    values = self.as_dict()
+    return [_MISSING.get(name, 0) if values.get(name) is None else values[name] for name in fieldnames or FIELDNAMES]
+
+
+# one slotted instance per scraped property, None until the scraper finds the value
+# (extra too, until a field outside the schema is set)
+PropertyRecord = dataclasses.make_dataclass(
+    "PropertyRecord",
+    [(name, _PYTHON_TYPES[arrow_type], dataclasses.field(default=None)) for name, arrow_type, _ in PROPERTY_SCHEMA]
+    + [("extra", dict, dataclasses.field(default=None, repr=False))],
+    namespace={"set": _set, "update": _update, "as_dict": _as_dict, "row": _row},
+    slots=True,
+)
+PropertyRecord.__module__ = __name__
+
+
+def arrow_schema():
+    import pyarrow as pa
+    return pa.schema([(name, pa.type_for_alias(arrow_type)) for name, arrow_type, _ in PROPERTY_SCHEMA])
+
+
+def records_to_arrow(records):
+    """Record batch of the records, typed by the schema.
+
+    It carries what the csv carries: missing numeric fields 0, missing text and
+    coordinates null (an empty csv cell reads back as null), and the traveler
+    types outside the schema as extra columns.
+    """
+    import pyarrow as pa
+    schema = arrow_schema()
+    columns = zip(*map(_values, records)) if records else [()] * len(FIELDNAMES)
+    arrays = [
+        pa.array(column if missing == "" else [missing if value is None else value for value in column],
+                 type=field.type)
+        for column, field, missing in zip(columns, schema, MISSING_VALUES)
+    ]
+    for name in sorted({name for record in records for name in record.extra or ()}):
+        arrays.append(pa.array([(record.extra or {}).get(name, 0) for record in records]))
+        schema = schema.append(pa.field(name, arrays[-1].type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_records(records, path):
+    """Write the records as one parquet file, the typed alternative to save_to_csv"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    pq.write_table(pa.Table.from_batches([records_to_arrow(records)]), path)